@@ -1,7 +1,5 @@
-from specklepy.api.credentials import get_default_account
-from specklepy.transports.server import ServerTransport
-from specklepy.api.client import SpeckleClient
-from specklepy.api import operations
+import sys
+
 from specklepy.objects.base import Base
 from specklepy.core.api.inputs.version_inputs import CreateVersionInput
 import plotly.express as px
@@ -9,6 +7,13 @@ from specklepy.core.api.operations import serialize as core_serialize
 from specklepy.serialization.base_object_serializer import BaseObjectSerializer
 import pandas as pd
 from specklepy.objects import Base
+from version_fetcher import latest_version
+from speckle_connection import get_client, get_model, server_transport
+from embodied_carbon import aggregate_by_category, element_columns
+from property_assignment import assign_properties, load_material_table, walk_elements
+from object_cache import ObjectCache
+from object_upload import ServerObjectIndex, serialize_objects, upload_new
+from dry_run import OfflineProject, StageTimer
 
 
 # Identify the Project and Model
@@ -20,11 +25,34 @@ project_id = "d3e86261bf" #Farnsworth House
 model_id = "3a724a3d22"
 # model_id = "cd2eb6d0cc"
 
-# Set up authentication and connection to server
-client = SpeckleClient(host ="macad.speckle.xyz")
-account = get_default_account()
-client.authenticate_with_account(account)
-transport = ServerTransport(project_id, client)
+# Material, density and embodied carbon of each element category (CSV or JSON, see property_assignment.py)
+materials_table_path = "materials.csv"
+
+# Offline run: `python addPropertiesToSpeckleModel.py --dry-run fixture.json` reads the model from a fixture
+# (recorded with dry_run.record_fixture) and sends the result to memory instead of the server
+dry_run_fixture = sys.argv[sys.argv.index("--dry-run") + 1] if "--dry-run" in sys.argv else None
+# Time spent in each stage, printed at the end
+timer = StageTimer()
+
+if dry_run_fixture:
+    offline = OfflineProject(dry_run_fixture)
+    project_id = offline.id
+    # the model of the fixture with `model_id`, or its first model
+    if offline.get_model(model_id) is None:
+        model_id = offline.models[0].id
+    # the fixture stands in for the server and the object cache, nothing is known to be uploaded yet
+    # and nothing is written to disk
+    object_cache = offline
+    transport = offline.transport
+    server_objects = ServerObjectIndex(":memory:")
+else:
+    # Set up authentication and connection to server (the token from config.py, or your local Speckle account)
+    client = get_client()
+    transport = server_transport(project_id)
+    # Local cache of received objects, and index of the objects the server already has:
+    # only objects that are new or changed by this script are uploaded
+    object_cache = ObjectCache("speckle_objects.db")
+    server_objects = ServerObjectIndex("speckle_server_objects.db")
 
 # # Get a list of active projects
 # projects = client.active_user.get_projects(limit=3)
@@ -33,24 +61,30 @@ transport = ServerTransport(project_id, client)
 #     print(project.id)
 
 # Get a specific Model by ID
-my_model = client.model.get(model_id, project_id)
+my_model = offline.get_model(model_id) if dry_run_fixture else get_model(project_id, model_id)
 print(my_model.name)
 
 # Get the Referenced Object ID of the latest Version
-versions = client.version.get_versions(model_id, project_id)
-referenced_obj_id = versions.items[0].referencedObject
+if dry_run_fixture:
+    referenced_obj_id = offline.latest_version(model_id).referencedObject
+else:
+    referenced_obj_id = latest_version(client, project_id, model_id).referencedObject
 # Receive the referenced object (speckle object!)
 print("Fetching data from the server...")
-objData = operations.receive(referenced_obj_id, transport)
+with timer.stage("receive"):
+    objData = object_cache.receive(referenced_obj_id, transport)
+# everything we received is on the server already
+server_objects.add_tree(project_id, referenced_obj_id, object_cache.get_object(referenced_obj_id))
 
 # operatons.serialize
 print("Got the data!")
 
-speckle_object = objData["@Building"]
+# speckle_object = objData["@Building"]
 
-child_obj = speckle_object["@{0}"][0]
+# child_obj = speckle_object["@{0}"][0]
 
-# child_obj = objData
+# The whole tree is processed: every building and level
+child_obj = objData
 
 print("Received Base object")
 
@@ -69,110 +103,45 @@ print("Received Base object")
 # PART TO ASSIGN PROPERTIES TO OBJECTS
 
 
-MATERIALS_MAPPING = {
-    "@Floors": "Concrete",
-    "@FloorSlabs": "Concrete",
-    "@Walls": "Concrete",
-    "@Stairs": "Steel",
-    "@Facade": "Glass",
-    "@Roof": "Concrete",
-    "@Columns": "Steel",
-    "@Windows": "Glass",
-}
-
-DENSITY_MAPPING = {
-    "@Floors": 2400,
-    "@FloorSlabs": 2400,
-    "@Walls": 2400,
-    "@Stairs": 7800,
-    "@Facade": 2500,
-    "@Roof": 2400,
-    "@Columns": 7800,
-    "@Windows": 2500,
-}
-
-CARBON_MAPPING = {
-    "@Floors": 0.159,
-    "@FloorSlabs": 0.01,
-    "@Walls": 0.159,
-    "@Stairs": 0.13,
-    "@Facade": 20.85,
-    "@Roof": 0.159,
-    "@Columns": 1.37,
-    "@Windows": 0.11,
-}
-
-
-# first, get all the attribute names
-names = child_obj.get_dynamic_member_names()
-# then iterate through them to check if they exist in our mapping
-for name in names:
-    if name not in MATERIALS_MAPPING.keys():
-        break
-    # if they do, use this class method to get the class and init it
-    material = MATERIALS_MAPPING[name]
-    density = DENSITY_MAPPING[name]
-    carbon = CARBON_MAPPING[name]
-    # now we can add a `@material` attribute dynamically to each object.
-    # note that we're making it detachable with the `@`
-    prop = child_obj[name]
-    
-    if isinstance(prop, list):
-        for item in prop:
-            item["@material"] = material
-            item["@density"] = density
-            item["@embodied_carbon"] = carbon
-    else:
-        prop["@material"] = material
-        prop["@density"] = density
-        prop["@embodied_carbon"] = carbon
+# The mapping table: one row per category (`Floors`, `Walls`...) with its material, density and embodied carbon
+MATERIALS_TABLE = load_material_table(materials_table_path)
+
+# Walk the whole tree once: every element found under a category of the table gets
+# `@material`, `@density` and `@embodied_carbon` (the `@` makes them detachable)
+with timer.stage("transform"):
+    report = assign_properties(child_obj, MATERIALS_TABLE)
+print(f"Assigned properties to {report['assigned']} elements {report['assigned_categories']}")
+print(f"{report['unmatched']} elements have no category in the table {report['unmatched_categories']}")
 
 print("Properties assigned")
 
-# Send the updated object back to the server
-send_transport = ServerTransport(project_id, client) #sending to a different project/model
-hash = operations.send(base=child_obj, transports=[send_transport])
+# Send the updated object back to the server, only the objects the server doesn't have yet
+send_transport = offline.sent if dry_run_fixture else server_transport(project_id) #sending to a different project/model
+with timer.stage("serialize"):
+    hash, objects = serialize_objects(child_obj)
+with timer.stage("send"):
+    upload = upload_new(objects, send_transport, server_objects)
+print(f"Sent {upload['objects_sent']} objects ({upload['bytes_sent'] / 1e6:.2f}MB), "
+      f"skipped {upload['objects_skipped']} already on the server ({upload['bytes_skipped'] / 1e6:.2f}MB)")
 
 # Create the actual commit that references this object
-version_data = CreateVersionInput(objectId=hash, modelId=model_id, projectId=project_id, message = "properties assigned (density & embodied carbon)", sourceApplication = "Python")
-client.version.create(version_data)
-print("New version was sent!")
+if dry_run_fixture:
+    print(f"Dry run: no version created for {hash}")
+else:
+    version_data = CreateVersionInput(objectId=hash, modelId=model_id, projectId=project_id, message = "properties assigned (density & embodied carbon)", sourceApplication = "Python")
+    client.version.create(version_data)
+    print("New version was sent!")
+print(timer.report())
 
 
 
 #  //////////////////////////////////////////////////////////////////////////////////////////
 
-data = {"element": [], "volume": [], "mass": [], "embodied carbon": []}
 # child_obj = objData["@Building"]['@{0}'][0]
-# # get the attributes on the level object
-# names = child_obj.get_dynamic_member_names()
-# iterate through and find the elements with a `volume` attribute
-for name in names:
-    if name not in MATERIALS_MAPPING.keys():
-        break
-    prop = child_obj[name]
-    if isinstance(prop, list):
-            for p in prop:
-                volume = 0
-                mass = 0
-                carbon = 0
-                if name == '@Windows':
-                    volume += p.area * 70
-                    mass += p.area * 70 * p["@density"]
-                    carbon += p.area * 70 * p["@density"] * p["@embodied_carbon"]
-                else:
-                    volume += p.volume
-                    mass += p.volume * p["@density"]
-                    carbon += p.volume * p["@density"] * p["@embodied_carbon"]
-    else:
-        volume = prop.volume
-        mass = prop.volume * prop["@density"]
-        carbon = prop.volume * prop["@density"] * prop["@embodied_carbon"]
-
-    data["volume"].append(volume)
-    data["mass"].append(mass)
-    data["embodied carbon"].append(carbon)
-    data["element"].append(name[1:]) # removing the prepending `@`
+# per element columns of the mapped categories (whole tree), then summed per category in one vectorized pass
+data = aggregate_by_category(element_columns(
+    (f"@{category}", element) for category, element in walk_elements(child_obj) if category in MATERIALS_TABLE
+))
 
 print("Finished!")
 print(data)
@@ -205,8 +174,10 @@ figures["carbon pie"] = px.pie(
     color="element",
     title="Embodied Carbon by Element (kgC02)",
 )
-for figure in figures:
-    figures[figure].show()
+# the dry run only measures the pipeline, no browser tabs
+if not dry_run_fixture:
+    for figure in figures:
+        figures[figure].show()
 
  
 
@@ -0,0 +1,62 @@
+import threading
+
+import gradio as gr
+
+
+class BackgroundLoader:
+    # Runs a loading function in a background thread so the page can be served before
+    # its data is ready. The function receives `publish(name, value)` and calls it for
+    # every piece of data as soon as it is computed; page handlers stream those values
+    # to their components as they arrive.
+    def __init__(self, target, name="background-loader"):
+        self.values = {}
+        self.error = None
+        self.done = False
+        self._target = target
+        self._changed = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            self._target(self.publish)
+        except Exception as ex:
+            self.error = ex
+            self.publish("status", f"Loading failed: {ex}")
+        finally:
+            with self._changed:
+                self.done = True
+                self._changed.notify_all()
+
+    def publish(self, name, value):
+        with self._changed:
+            self.values[name] = value
+            self._changed.notify_all()
+
+    def get(self, name, default=None):
+        return self.values.get(name, default)
+
+    def wait(self, name, timeout=None):
+        # Blocks until `name` is published (or loading ended without it)
+        with self._changed:
+            self._changed.wait_for(lambda: name in self.values or self.done, timeout=timeout)
+            return self.values.get(name)
+
+    def stream(self, names):
+        # Yields one list per update with an entry per name: the published value the first
+        # time it is available, gr.update() (no change) otherwise
+        sent = set()
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self.done or any(n in self.values and n not in sent for n in names))
+                values = dict(self.values)
+                done = self.done
+            new = {n for n in names if n in values and n not in sent}
+            if new:
+                yield [values[n] if n in new else gr.update() for n in names]
+                sent |= new
+            if done or len(sent) == len(names):
+                return
@@ -0,0 +1,144 @@
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import numpy as np
+
+from building_analysis import POINT_BUDGET, analyze_building_data, generate_graphs, generate_scatterplot
+from project_snapshot import ProjectSnapshot
+from space_calculator import create_dataframe, create_df_categoryTotals, create_piechart, values
+from synthetic_models import SyntheticVersionFetcher, synthetic_model, synthetic_versions
+from version_store import VersionStore
+
+# Run with `python benchmark.py --output bench.json`, then compare the JSON files of two commits.
+# Every function is timed on synthetic data of each size (elements per model, versions per model)
+
+# Elements of the synthetic building models
+MODEL_SIZES = [1000, 10000, 50000]
+# Versions per model of the synthetic project histories (20 models each)
+HISTORY_SIZES = [100, 1000]
+# Timed calls of each function, the peak memory is measured on one extra call
+REPEAT = 5
+
+
+def measure(func, repeat=REPEAT):
+    # Seconds taken by each of `repeat` calls, and the peak memory allocated by one more call.
+    # tracemalloc slows the code down, so the timed calls run without it.
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "repeat": repeat,
+        "time_min": min(times),
+        "time_median": statistics.median(times),
+        "time_max": max(times),
+        "peak_memory_bytes": peak,
+    }
+
+
+def building_benchmarks(sizes, categories, vertices_per_mesh, repeat):
+    for size in sizes:
+        model = synthetic_model(size, categories, vertices_per_mesh)
+        data, vertices = analyze_building_data(model)
+        params = {"elements": size, "categories": categories, "vertices": len(vertices["xyz"])}
+        yield "analyze_building_data", params, measure(lambda: analyze_building_data(model), repeat)
+        yield "generate_graphs", params, measure(lambda: generate_graphs(data), repeat)
+        yield "generate_scatterplot", {**params, "point_budget": POINT_BUDGET}, measure(lambda: generate_scatterplot(vertices), repeat)
+        yield "generate_scatterplot", {**params, "point_budget": None}, measure(lambda: generate_scatterplot(vertices, None), repeat)
+        # vertices as lists of Point objects, like the models exported with a `Vertices` member
+        points_model = synthetic_model(size, categories, vertices_per_mesh, point_lists=True)
+        yield "analyze_building_data", {**params, "vertex_layout": "point lists"}, measure(lambda: analyze_building_data(points_model), repeat)
+
+
+def space_calculator_benchmarks(repeat):
+    # The space table always has the same rows, only the values change
+    rng = np.random.default_rng(0)
+    inputs = rng.uniform(0.5, 20, len(values)).round(1).tolist()
+    df = create_dataframe(inputs, 1000000)
+    df_totals = create_df_categoryTotals(df)
+    params = {"rows": len(df)}
+    yield "create_dataframe", params, measure(lambda: create_dataframe(inputs, 1000000), repeat)
+    yield "create_df_categoryTotals", params, measure(lambda: create_df_categoryTotals(df), repeat)
+    yield "create_piechart", params, measure(
+        lambda: create_piechart(df["Total Area (m²)"][:-1], df["Sub-Category"][:-1], df["Category"][:-1]), repeat
+    )
+    yield "create_piechart", {"rows": len(df_totals)}, measure(
+        lambda: create_piechart(df_totals["Total Area (m²)"][:-1], df_totals["Category"][:-1], df_totals["Category"][:-1]), repeat
+    )
+
+
+def snapshot_benchmarks(sizes, repeat):
+    for size in sizes:
+        models, histories = synthetic_versions(versions=size)
+        project = SimpleNamespace(id="synthetic", models=SimpleNamespace(items=models))
+        fetcher = SyntheticVersionFetcher(histories)
+        params = {"models": len(models), "versions": size * len(models)}
+        # a first sync into an empty store, then a refresh without any new version
+        yield "ProjectSnapshot (full sync)", params, measure(lambda: ProjectSnapshot(None, project, fetcher, VersionStore(":memory:")), repeat)
+        store = VersionStore(":memory:")
+        snapshot = ProjectSnapshot(None, project, fetcher, store)
+        yield "ProjectSnapshot (refresh)", params, measure(lambda: ProjectSnapshot(None, project, fetcher, store), repeat)
+        yield "ProjectSnapshot.commit_counts", params, measure(snapshot.commit_counts, repeat)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(model_sizes=MODEL_SIZES, history_sizes=HISTORY_SIZES, categories=6, vertices_per_mesh=24, repeat=REPEAT):
+    results = []
+    for benchmarks in (
+        building_benchmarks(model_sizes, categories, vertices_per_mesh, repeat),
+        space_calculator_benchmarks(repeat),
+        snapshot_benchmarks(history_sizes, repeat),
+    ):
+        for function, params, measured in benchmarks:
+            # progress on stderr, stdout only gets the JSON
+            print(f"{function} {params}: {measured['time_median'] * 1000:.1f}ms, {measured['peak_memory_bytes'] / 1e6:.1f}MB", file=sys.stderr)
+            results.append({"function": function, "params": params, **measured})
+
+    return {
+        "commit": git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the dashboard compute functions on synthetic models")
+    parser.add_argument("--sizes", type=int, nargs="+", default=MODEL_SIZES, help="elements per synthetic model")
+    parser.add_argument("--history-sizes", type=int, nargs="+", default=HISTORY_SIZES, help="versions per synthetic model")
+    parser.add_argument("--categories", type=int, default=6)
+    parser.add_argument("--vertices-per-mesh", type=int, default=24)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--output", help="JSON file of the results, printed when not given")
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.history_sizes, args.categories, args.vertices_per_mesh, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -1,33 +1,54 @@
+import threading
+import time
+from collections import OrderedDict
+
 import gradio as gr
 import pandas as pd
 import plotly.express as px
-from specklepy.api.client import SpeckleClient
-from specklepy.api.credentials import get_account_from_token
-from specklepy.transports.server import ServerTransport
-from specklepy.api import operations
-from config import speckle_token
+import plotly.graph_objects as go
+from speckle_connection import get_client, server_transport
+from version_fetcher import latest_version
+from object_cache import ObjectCache
+from embodied_carbon import aggregate_by_category, flatten_elements
+from mesh_vertices import decimate_vertices, extract_vertices
+from diagnostics import start_metrics_server, timed
+from diagnostics_page import instrument_handlers, render_diagnostics
 # import matplotlib.pyplot as plt
 
 # # Default project and model IDs
 # project_id = "d3e86261bf"  # Default to Farnsworth House
 # model_id = "3a724a3d22"
 
-# Initialize Speckle client and credentials
-speckle_server = "macad.speckle.xyz"
-client = SpeckleClient(host=speckle_server)
-account = get_account_from_token(speckle_token, speckle_server)
-client.authenticate_with_account(account)
+# Local cache of received objects, object ids are content hashes so it never goes stale
+object_cache = ObjectCache("speckle_objects.db", max_size_mb=1024)
+
+# Analysis results of the most recently viewed versions, keyed by their referencedObject
+ANALYSIS_CACHE_SIZE = 8
+analysis_cache = OrderedDict()
+analysis_cache_lock = threading.Lock()
+
+# Maximum number of vertices sent to the browser in the 3D scatter, unless full resolution is requested
+POINT_BUDGET = 50000
+
+# Prefetch and analyze every model in the background while the server starts
+WARM_UP_MODELS = True
+# Seconds a warmed model is served from memory before its latest version is checked again
+WARM_MODEL_TTL = 600
+# Seconds a page waits for a model still warming before showing the warm-up status instead,
+# and between two checks of the warm-up by an open page
+WARM_UP_WAIT = 2
+WARM_UP_CHECK_INTERVAL = 2
 
 model_name = 'kunsthaus zurich'
 project_id = "daeb18ed0a"
 model_id = "aab87740df"
 
+model_map = {
+    'farnsworth house': ("d3e86261bf", "3a724a3d22"),
+    'kunsthaus zurich': ("daeb18ed0a", "aab87740df")
+}
+
 def set_model_data(model_name):
-    model_map = {
-        'farnsworth house': ("d3e86261bf", "3a724a3d22"),
-        'kunsthaus zurich': ("daeb18ed0a", "aab87740df")
-    }
-    
     if model_name in model_map:
         project_id, model_id = model_map[model_name]
     else:
@@ -48,71 +69,27 @@ def set_model_data(model_name):
 #     return project_id, model_id
 
 
-def create_viewer_url(project_id, model_id):
+def create_viewer_url(project_id, model_id, selected_version):
     # print(f"Creating viewer URL for project_id: {project_id}, model_id: {model_id}")
-    versions = client.version.get_versions(model_id=model_id, project_id=project_id, limit=100).items
-    if not versions:
-        return "<p>Error: No versions found for this model.</p>"
-    selected_version = versions[0]
-    
     embed_src = f"https://macad.speckle.xyz/projects/{project_id}/models/{model_id}@{selected_version.id}#embed=%7B%22isEnabled%22%3Atrue%2C%7D"
     return embed_src
 
-def get_model_data(model_name):
-    
-    # Set the global project_id and model_id based on selection
-    project_id, model_id = set_model_data(model_name)
-
-    # Get version details
-    versions = client.version.get_versions(model_id=model_id, project_id=project_id, limit=100).items
-    selected_version = versions[0]
-    referenced_obj_id = selected_version.referencedObject
-    
-    # Create a fresh transport for each request
-    transport = ServerTransport(project_id, client)
+def get_model_data(project_id, referenced_obj_id):
+    # The server is only used when the object is not in the local cache yet
+    transport = server_transport(project_id)
     
     # Get object data
-    objData = operations.receive(referenced_obj_id, transport)
+    objData = object_cache.receive(referenced_obj_id, transport)
     
     return objData
 
 
 def analyze_building_data(objData):
     child_obj = objData
-    data = {"element": [], "volume": [], "mass": [], "embodied carbon": []}
-    
-    # get the attributes on the level object
-    names = child_obj.get_dynamic_member_names()
-    # iterate through and find the elements with a `volume` attribute
-    for name in names:
-        prop = child_obj[name]
-        if isinstance(prop, list):
-                for p in prop:
-                    volume = 0
-                    mass = 0
-                    carbon = 0
-                    if name == '@Windows':
-                        volume += p.area * 70
-                        mass += p.area * 70 * p["@density"]
-                        carbon += p.area * 70 * p["@density"] * p["@embodied_carbon"]
-                    else:
-                        volume += p.volume
-                        mass += p.volume * p["@density"]
-                        carbon += p.volume * p["@density"] * p["@embodied_carbon"]
-        else:
-            volume = prop.volume
-            mass = prop.volume * prop["@density"]
-            carbon = prop.volume * prop["@density"] * prop["@embodied_carbon"]
-        data["volume"].append(volume)
-        data["mass"].append(mass)
-        data["embodied carbon"].append(carbon)
-        data["element"].append(name[1:])  # removing the prepending `@`
-    
-    vertices = []
-    for name in names:
-        for element in child_obj[name]:
-            for p in element.Vertices:
-                vertices.append({"x": p.x, "y": p.y, "z": p.z, "element": name[1:]})
+    # per element columns, then summed per category in one vectorized pass
+    data = aggregate_by_category(flatten_elements(child_obj))
+    # float32 (n, 3) array of every vertex, with the element category code of each vertex
+    vertices = extract_vertices(child_obj)
     
     return data, vertices
 
@@ -156,17 +133,25 @@ def generate_graphs(data):
     return volumes_fig, carbon_bar_fig, carbon_pie_fig
 
 
-def generate_scatterplot(vertices):
-    fig = px.scatter_3d(
-        vertices,
-        x="x",
-        y="y",
-        z="z",
-        color="element",
-        opacity=0.7,
-        title="Element Vertices (m)",
-        color_discrete_sequence=px.colors.qualitative.Set2,
-    )
+def generate_scatterplot(vertices, point_budget=POINT_BUDGET):
+    if point_budget is not None:
+        vertices = decimate_vertices(vertices, point_budget)
+    xyz = vertices["xyz"]
+    colors = px.colors.qualitative.Set2
+    # one trace per element category, fed straight from the vertex arrays
+    fig = go.Figure()
+    for code, element in enumerate(vertices["categories"]):
+        points = xyz[vertices["element"] == code]
+        fig.add_trace(go.Scatter3d(
+            x=points[:, 0],
+            y=points[:, 1],
+            z=points[:, 2],
+            mode="markers",
+            name=element,
+            opacity=0.7,
+            marker=dict(color=colors[code % len(colors)]),
+        ))
+    fig.update_layout(title="Element Vertices (m)", legend_title_text="element")
 
     fig.update_traces(marker=dict(size=4))
     
@@ -207,15 +192,127 @@ def generate_scatterplot(vertices):
     )
     return fig
     
-def update_all(model_name):
+def analyze_version(project_id, referenced_obj_id):
+    # A version's data never changes, so its results are reused until evicted
+    with analysis_cache_lock:
+        if referenced_obj_id in analysis_cache:
+            analysis_cache.move_to_end(referenced_obj_id)
+            return analysis_cache[referenced_obj_id]
+
+    with timed("compute", "building receive"):
+        objData = get_model_data(project_id, referenced_obj_id)
+    with timed("compute", "building analysis"):
+        data, vertices = analyze_building_data(objData)
+    with timed("compute", "building graphs"):
+        volumes_fig, carbon_bar_fig, carbon_pie_fig = generate_graphs(data)
+    result = {
+        "data": data,
+        "vertices": vertices,
+        "figures": (volumes_fig, carbon_pie_fig, carbon_bar_fig),
+        # scatter plots are built on demand, one per resolution
+        "scatter": {},
+    }
+
+    with analysis_cache_lock:
+        analysis_cache[referenced_obj_id] = result
+        while len(analysis_cache) > ANALYSIS_CACHE_SIZE:
+            analysis_cache.popitem(last=False)
+    return result
+
+def get_scatterplot(result, full_resolution):
+    if full_resolution not in result["scatter"]:
+        point_budget = None if full_resolution else POINT_BUDGET
+        with timed("compute", "building scatterplot"):
+            result["scatter"][full_resolution] = generate_scatterplot(result["vertices"], point_budget)
+    scatter_plot = result["scatter"][full_resolution]
+    shown = sum(len(trace.x) for trace in scatter_plot.data)
+    total = len(result["vertices"]["xyz"])
+    return scatter_plot, f"Showing {shown:,} of {total:,} vertices"
+
+# Latest version and analysis of every warmed model: model_name -> (loaded_at, version, result)
+warm_models = {}
+warmup_status = {name: "pending" for name in model_map}
+warmup_done = {name: threading.Event() for name in model_map}
+# Set once the warm-up thread runs: importing the module or hot reload (`gradio building_analysis.py`)
+# don't start it, and models are then loaded on first use
+warmup_started = False
+
+def load_model(model_name):
+    project_id, model_id = set_model_data(model_name)
+    # Speckle client shared with the other pages, authenticated on first use
+    selected_version = latest_version(get_client(), project_id, model_id)
+    if selected_version is None:
+        return None, None
+    result = analyze_version(project_id, selected_version.referencedObject)
+    warm_models[model_name] = (time.time(), selected_version, result)
+    return selected_version, result
+
+def model_warming(model_name, timeout=WARM_UP_WAIT):
+    # True while the warm-up is still loading the model, after waiting up to `timeout` seconds for it.
+    # Callers show the warm-up status then, rather than loading the model a second time.
+    return warmup_started and not warmup_done[model_name].wait(timeout)
+
+def get_model(model_name):
+    # Served from memory when the model was loaded recently, otherwise loaded again
+    # (the analysis itself is still reused when the latest version didn't change)
+    set_model_data(model_name)
+    if model_name in warm_models:
+        loaded_at, selected_version, result = warm_models[model_name]
+        if time.time() - loaded_at < WARM_MODEL_TTL:
+            return selected_version, result
+    return load_model(model_name)
+
+def warm_up_models():
+    # the model shown on page load goes first
+    for name in sorted(model_map, key=lambda name: name != model_name):
+        warmup_status[name] = "warming"
+        try:
+            selected_version, result = load_model(name)
+            if result is not None:
+                get_scatterplot(result, False)
+            warmup_status[name] = "ready"
+        except Exception as ex:
+            warmup_status[name] = f"failed ({ex})"
+        finally:
+            warmup_done[name].set()
+
+def start_warm_up():
+    global warmup_started
+    warmup_started = True
+    threading.Thread(target=warm_up_models, name="warm-up", daemon=True).start()
+
+def warmup_info():
+    if not warmup_started:
+        return ""
+    return " · ".join(f"{name}: {status}" for name, status in warmup_status.items())
+
+def update_all(model_name, full_resolution=False):
+    # The last output tells the page whether it still waits for the model to warm up
     project_id, model_id = set_model_data(model_name)
-    objData = get_model_data(model_name)
-    data, vertices = analyze_building_data(objData)
-    graphs = generate_graphs(data)
-    scatter_plot = generate_scatterplot(vertices)
-    viewer_url = create_viewer_url(project_id, model_id)
+    if model_warming(model_name):
+        return f"<p>{model_name} is still warming up, it will show here when ready.</p>", None, None, None, None, "", warmup_info(), True
+    selected_version, result = get_model(model_name)
+    if selected_version is None:
+        return "<p>Error: No versions found for this model.</p>", None, None, None, None, "", warmup_info(), False
+
+    viewer_url = create_viewer_url(project_id, model_id, selected_version)
+    scatter_plot, points_info = get_scatterplot(result, full_resolution)
     
-    return f'<iframe src="{viewer_url}" style="width:100%; height:750px; border:none;"></iframe>', graphs[0], graphs[2], graphs[1], scatter_plot
+    return f'<iframe src="{viewer_url}" style="width:100%; height:750px; border:none;"></iframe>', *result["figures"], scatter_plot, points_info, warmup_info(), False
+
+def check_warm_up(model_name, full_resolution, waiting):
+    # Refreshes the warm-up status of an open page, and fills the page in once the model it waits for is ready
+    if waiting and not model_warming(model_name, timeout=0):
+        return update_all(model_name, full_resolution)
+    return *[gr.update()] * 6, warmup_info(), waiting
+
+def update_scatter(model_name, full_resolution):
+    if model_warming(model_name):
+        return gr.update(), "Still warming up..."
+    selected_version, result = get_model(model_name)
+    if selected_version is None:
+        return None, ""
+    return get_scatterplot(result, full_resolution)
 
 
 # Create Gradio interface
@@ -224,6 +321,9 @@ with gr.Blocks(title="Building Analysis") as demo:
     
     with gr.Row():
         model_dropdown = gr.Dropdown(value='kunsthaus zurich', label="Select Model", choices = ['farnsworth house', 'kunsthaus zurich'], allow_custom_value=True)
+        warmup_text = gr.Markdown(warmup_info)
+        waiting_for_warm_up = gr.State(False)
+        warmup_timer = gr.Timer(WARM_UP_CHECK_INTERVAL)
     with gr.Row(equal_height=True):
         viewer_iframe = gr.HTML()
         
@@ -237,6 +337,9 @@ with gr.Blocks(title="Building Analysis") as demo:
     
     carbon_bar = gr.Plot(container=False, show_label=False)
     
+    with gr.Row():
+        full_resolution = gr.Checkbox(value=False, label="Full resolution (all vertices, slow on large models)")
+        points_info = gr.Markdown()
     with gr.Row():
         scatter = gr.Plot(container=False, show_label=False)
     
@@ -245,17 +348,41 @@ with gr.Blocks(title="Building Analysis") as demo:
 
     demo.load(
         fn=update_all,
-        inputs=model_dropdown,
-        outputs=[viewer_iframe, volume_pie, carbon_pie, carbon_bar, scatter]
+        inputs=[model_dropdown, full_resolution],
+        outputs=[viewer_iframe, volume_pie, carbon_pie, carbon_bar, scatter, points_info, warmup_text, waiting_for_warm_up]
     )
     
     model_dropdown.change(
         fn=update_all,
-        inputs=model_dropdown,
-        outputs=[viewer_iframe, volume_pie, carbon_pie, carbon_bar, scatter]
+        inputs=[model_dropdown, full_resolution],
+        outputs=[viewer_iframe, volume_pie, carbon_pie, carbon_bar, scatter, points_info, warmup_text, waiting_for_warm_up]
+    )
+
+    full_resolution.change(
+        fn=update_scatter,
+        inputs=[model_dropdown, full_resolution],
+        outputs=[scatter, points_info]
     )
 
-demo.launch()
+    warmup_timer.tick(
+        fn=check_warm_up,
+        inputs=[model_dropdown, full_resolution, waiting_for_warm_up],
+        outputs=[viewer_iframe, volume_pie, carbon_pie, carbon_bar, scatter, points_info, warmup_text, waiting_for_warm_up]
+    )
+
+    # Where the time goes: event handlers, Speckle requests and analysis stages
+    with gr.Tab("Diagnostics"):
+        render_diagnostics()
+
+instrument_handlers(demo)
+
+# Importing this module (benchmark.py does) builds the functions and the layout only:
+# nothing is downloaded and no server is started
+if __name__ == "__main__":
+    if WARM_UP_MODELS:
+        start_warm_up()
+    start_metrics_server()
+    demo.launch()
 
 # gradio building_analysis.py
 
@@ -1,52 +1,96 @@
+import fnmatch
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
-from specklepy.api.client import SpeckleClient
-from specklepy.api import operations
 from specklepy.api.wrapper import StreamWrapper
 from specklepy.objects import Base
 from specklepy.core.api.inputs.version_inputs import CreateVersionInput
+from speckle_connection import get_client, iter_models, server_transport
+from version_fetcher import BulkVersionFetcher
+from object_cache import ObjectCache
+from federation import changed_branches, fetch_closures, load_manifest, reference_federation, save_manifest, send_objects
+from object_upload import serialize_objects
+from dry_run import OfflineProject, StageTimer
 
 # This script will combine the latest commit of each branch 
 # and push it into a new branch of your choice.
-# Dont forget to change your token and stream_url before running! :)
+# Dont forget to set your token in config.py and change stream_url before running! :)
 
-# Our MaCAD server!
-server_url = "https://macad.speckle.xyz/"
-# The token for your account. Get it from the Speckle Dashboard > Profile > Acess Tokens
-token = ""
+# Our MaCAD server and your account are set up in speckle_connection.py: the token comes from config.py
+# (get it from the Speckle Dashboard > Profile > Acess Tokens), or your local Speckle account is used
 # This is the stream you want to federate the branches of. Change it to your studio stream! 
 stream_url = "https://macad.speckle.xyz/projects/28a211b286"
 # The name of the branch you want to push to. The data inside it will be ignored on further pushes.
 federated_branch = "combined branches"
+# The project and model receiving the combined commits
+federated_project_id = "28a211b286"
+federated_model_id = "9a4afc23f0"
+# What was federated last time: branches whose latest commit didn't move are skipped,
+# and no commit is made when nothing changed
+manifest_path = "federation_manifest.json"
 # A list containing branch names that you dont want federated. Change this according to your stream.
+# Glob patterns work too, e.g. "shared/*" skips every branch under shared/
 filter_branches = [ "residential/base-geometry/mass_v1","service/podium","industrial/place holder/massing/mep cores", "shared/site"]
-
-# Authenticate the account with the token (for servers or remote scripts that don´t have access to your local speckle account)
-client = SpeckleClient(host=server_url)
-client.authenticate_with_token(token)
-
-# Get the stream object and a transport object
-wrapper = StreamWrapper(stream_url)
-stream_id = wrapper.stream_id
-transport = wrapper.get_transport()
-
-# Get the branch objects, their names and their IDs
-branches = client.branch.list(stream_id, 50)
+# True: the federated commit only points at the branch objects already on the server, only a small
+# wrapper object is uploaded. False: every branch is downloaded and the whole combined model is sent again.
+federate_by_reference = True
+# How many branches are downloaded at the same time
+max_concurrent_receives = 4
+
+# Offline run: `python combineSeveralModels.py --dry-run fixture.json` federates the branches of a fixture
+# (recorded with dry_run.record_fixture) and sends to memory. Each dry run starts from an empty manifest,
+# so the whole pipeline runs (and is timed) every time. With --keep-manifest the manifest is kept next
+# to the fixture instead, and the following dry runs only process what changed, like real runs.
+dry_run_fixture = sys.argv[sys.argv.index("--dry-run") + 1] if "--dry-run" in sys.argv else None
+keep_manifest = "--keep-manifest" in sys.argv
+# Time spent in each stage, printed at the end
+timer = StageTimer()
+
+if dry_run_fixture:
+    offline = OfflineProject(dry_run_fixture)
+    stream_id = offline.id
+    # the fixture stands in for the server and the object cache, nothing is written to disk
+    # (but the manifest, with --keep-manifest)
+    object_cache = offline
+    transport = offline.transport
+    send_transport = offline.sent
+    manifest_path = dry_run_fixture + ".manifest.json" if keep_manifest else None
+    branches = offline.models
+    latest_commits = offline.latest_versions(branches)
+else:
+    # Authenticated client shared through speckle_connection
+    client = get_client()
+    # Local cache of received objects: objects shared by several branches (or already received
+    # by a previous run) are only downloaded once
+    object_cache = ObjectCache("speckle_objects.db")
+
+    # Get the stream object and a transport object
+    wrapper = StreamWrapper(stream_url)
+    stream_id = wrapper.stream_id
+    transport = send_transport = server_transport(stream_id)
+
+    # Get the branch objects (every page of them), their names and their IDs,
+    # and the latest commit of each branch in a few batched requests
+    branches = list(iter_models(stream_id))
+    latest_commits = BulkVersionFetcher(client).latest_versions(stream_id, branches)
 branches_ids = [branch.id for branch in branches]
 branches_names = [branch.name for branch in branches]
 
-# Lets beggin with an empty list to store the commit IDs
+# Lets beggin with an empty list to store the commit IDs, and the branch each one comes from
 referenced_objects_ids = []
+heads = {}
 # Now we loop through each branch, get the latest commit (obj_id) 
 # and extract their referenced_object (the geometry data itself!)
-for branch in branches:
-    # Match branch.name to the names of the branches you dont want to federate
-    if branch.name in filter_branches:
+for branch, latest_commit in zip(branches, latest_commits):
+    # Match branch.name to the names (or patterns) of the branches you dont want to federate,
+    # and never federate the combined branch into itself
+    if branch.id == federated_model_id or any(fnmatch.fnmatchcase(branch.name, pattern) for pattern in filter_branches):
         continue
     # If the branch is not empty, get the referenced object ID of the latest commit
-    if len(branch.commits.items) > 0:
-        print(f"federating branch named {branch.name}")
-        obj_id = branch.commits.items[0].referencedObject
+    if latest_commit is not None:
+        obj_id = latest_commit["referencedObject"]
         referenced_objects_ids.append(obj_id)
+        heads[branch.name] = obj_id
     # If the branch is empty, ignore it
     else:
         print(f"{branch.name} was empty, ignoring")
@@ -54,20 +98,60 @@ for branch in branches:
 
 print(f"Got data from {len(referenced_objects_ids)} branches")
 
-# Now that we have the referenced_objects IDs, we can pass it to the operations.receive method to get the actual data
-commit_data = [operations.receive(obj_id=ref_obj, remote_transport=transport) for ref_obj in referenced_objects_ids]
-#commit_data = operations.receive(obj_id=referenced_objects_ids[0])
-print("Received all data")
-
-# Now we create a Speckle Object (its called Base in speckle lingo)
-federated_commit_object = Base(speckle_type="Federation.Granular")
-
-# We put the commit_data inside of it
-federated_commit_object["@Components"] = commit_data
-
-# We send it to the Speckle Server DB to get a unique identifier for this speckle object
-# Remember...commits dont hold data in themselves...They point to objects in the database!
-hash3 = operations.send(base=federated_commit_object , transports=[transport])
+# Compare with what was federated last time: only the branches whose latest commit moved are processed,
+# and when none did (and none was removed) there is nothing to commit
+manifest = load_manifest(manifest_path) if manifest_path else None
+if manifest is None or (manifest["projectId"], manifest["modelId"]) != (federated_project_id, federated_model_id):
+    manifest = {"projectId": federated_project_id, "modelId": federated_model_id, "objectId": None, "branches": {}}
+changed, removed = changed_branches(manifest, heads)
+for name in changed:
+    print(f"federating branch named {name}")
+for name in removed:
+    print(f"{name} is no longer federated")
+if manifest["objectId"] and not changed and not removed:
+    print("Nothing changed since the last federation, no new commit")
+    sys.exit(0)
+
+if federate_by_reference:
+    # The branch objects are already in the Speckle Server DB, the federated object only references them.
+    # Only the root objects of the branches that changed are read (for the list of children the viewer has to load)
+    known = {name: manifest["branches"][name]["closure"] for name in heads
+             if name not in changed and manifest["branches"][name].get("closure") is not None}
+    missing = [obj_id for name, obj_id in heads.items() if name not in known]
+    with timer.stage("receive"):
+        fetched = fetch_closures(transport, missing, cache=object_cache, max_workers=max_concurrent_receives)
+    closures = {name: known[name] if name in known else fetched[obj_id] for name, obj_id in heads.items()}
+    with timer.stage("serialize"):
+        hash3, federated_commit_json = reference_federation({heads[name]: closures[name] for name in heads})
+    with timer.stage("send"):
+        send_objects(send_transport, {hash3: federated_commit_json})
+    print(f"Sent the federated object ({len(federated_commit_json)} bytes) referencing {len(heads)} branches")
+else:
+    # Now that we have the referenced_objects IDs, we can receive the actual data, several branches at a time.
+    # Each receive uses its own transport, all of them go through the object cache
+    # (branches that did not change since the last run come from the cache without any download)
+    def receive_branch(ref_obj):
+        return object_cache.receive(ref_obj, transport if dry_run_fixture else server_transport(stream_id))
+
+    with timer.stage("receive"), ThreadPoolExecutor(max_workers=max_concurrent_receives) as pool:
+        commit_data = list(pool.map(receive_branch, referenced_objects_ids))
+    #commit_data = operations.receive(obj_id=referenced_objects_ids[0])
+    print("Received all data", object_cache.stats())
+    closures = {name: None for name in heads}
+
+    # Now we create a Speckle Object (its called Base in speckle lingo)
+    with timer.stage("transform"):
+        federated_commit_object = Base(speckle_type="Federation.Granular")
+
+        # We put the commit_data inside of it
+        federated_commit_object["@Components"] = commit_data
+
+    # We send it to the Speckle Server DB to get a unique identifier for this speckle object
+    # Remember...commits dont hold data in themselves...They point to objects in the database!
+    with timer.stage("serialize"):
+        hash3, federated_objects = serialize_objects(federated_commit_object)
+    with timer.stage("send"):
+        send_objects(send_transport, federated_objects)
 
 # # We create a function just to handle the two type of situations:
 # # If the federated branch already exists, we push into it
@@ -91,12 +175,22 @@ hash3 = operations.send(base=federated_commit_object , transports=[transport])
 
 
 
-version_data = CreateVersionInput(objectId=hash3, 
-                                  modelId="9a4afc23f0", 
-                                  projectId="28a211b286",
-                                  message="Combined models of towers from Residential, Service and Industrial Teams",
-                                  sourceApplication="Python")
-client.version.create(version_data)
+if dry_run_fixture:
+    print(f"Dry run: no version created for {hash3}")
+else:
+    version_data = CreateVersionInput(objectId=hash3, 
+                                      modelId=federated_model_id, 
+                                      projectId=federated_project_id,
+                                      message="Combined models of towers from Residential, Service and Industrial Teams",
+                                      sourceApplication="Python")
+    client.version.create(version_data)
+    print("Made a new commit")
+
+# Remember what this commit federates, for the next run
+manifest["objectId"] = hash3
+manifest["branches"] = {name: {"referencedObject": obj_id, "closure": closures[name]} for name, obj_id in heads.items()}
+if manifest_path:
+    save_manifest(manifest, manifest_path)
 
-print("Made a new commit")
+print(timer.report())
 print("Done!")
\ No newline at end of file
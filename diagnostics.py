@@ -0,0 +1,266 @@
+import bisect
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import requests
+
+# Upper bounds (seconds) of the latency histogram buckets, as Prometheus histograms
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# The rolling percentiles cover the last ROLLING_SLOTS slots of ROLLING_SLOT seconds (5 minutes)
+ROLLING_SLOT = 30
+ROLLING_SLOTS = 10
+# Port of the Prometheus text endpoint (/metrics), METRICS_PORT in the environment
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9464))
+# The endpoint has no authentication, it only listens on localhost unless METRICS_HOST says
+# otherwise (e.g. METRICS_HOST=0.0.0.0 for a scraper on another machine)
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+
+# What is measured: Gradio event handlers, requests to the Speckle server, computation stages
+KINDS = {
+    "callback": "Gradio event handlers",
+    "speckle": "Requests to the Speckle server",
+    "compute": "Computation stages",
+}
+
+
+def quantile(counts, q):
+    # Estimated from histogram bucket counts, interpolating inside the bucket like Prometheus' histogram_quantile
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    for i, count in enumerate(counts):
+        if count and cumulative + count >= rank:
+            if i == len(BUCKETS):
+                return BUCKETS[-1]
+            lower = BUCKETS[i - 1] if i else 0
+            return lower + (BUCKETS[i] - lower) * (rank - cumulative) / count
+        cumulative += count
+    return BUCKETS[-1]
+
+
+class Series:
+    # Everything recorded under one name: totals since the start, a latency histogram,
+    # and per-slot histograms of the last few minutes for the rolling percentiles
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.bytes_sent = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.slots = deque()
+
+    def observe(self, seconds, nbytes, sent, error, now):
+        bucket = bisect.bisect_left(BUCKETS, seconds)
+        self.count += 1
+        self.errors += bool(error)
+        self.seconds += seconds
+        self.bytes += nbytes
+        self.bytes_sent += sent
+        self.buckets[bucket] += 1
+
+        slot = int(now // ROLLING_SLOT)
+        if not self.slots or self.slots[-1][0] != slot:
+            self.slots.append((slot, [0] * len(self.buckets)))
+        self.slots[-1][1][bucket] += 1
+        while self.slots[0][0] <= slot - ROLLING_SLOTS:
+            self.slots.popleft()
+
+    def rolling(self, now):
+        # Bucket counts of the rolling window
+        first = int(now // ROLLING_SLOT) - ROLLING_SLOTS + 1
+        counts = [0] * len(self.buckets)
+        for slot, slot_counts in self.slots:
+            if slot >= first:
+                counts = [a + b for a, b in zip(counts, slot_counts)]
+        return counts
+
+
+class Registry:
+    # Counts, latencies and bytes of everything measured in the process, by kind and name
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {kind: {} for kind in KINDS}
+
+    def observe(self, kind, name, seconds, nbytes=0, error=False, sent=0):
+        # `nbytes` received and `sent` bytes sent, for requests
+        with self._lock:
+            series = self._series[kind].get(name)
+            if series is None:
+                series = self._series[kind][name] = Series()
+            series.observe(seconds, nbytes, sent, error, time.time())
+
+    @contextmanager
+    def timed(self, kind, name):
+        start = time.perf_counter()
+        error = True
+        try:
+            yield
+            error = False
+        finally:
+            self.observe(kind, name, time.perf_counter() - start, error=error)
+
+    def rows(self, kind):
+        # One row per name for the diagnostics page: calls, errors, mean and rolling percentiles (ms),
+        # MB received and sent
+        now = time.time()
+        rows = []
+        with self._lock:
+            for name, s in sorted(self._series[kind].items()):
+                rolling = s.rolling(now)
+                p50, p95, p99 = (quantile(rolling, q) for q in (0.5, 0.95, 0.99))
+                rows.append([
+                    name,
+                    s.count,
+                    s.errors,
+                    round(s.seconds / s.count * 1000, 1),
+                    *(round(p * 1000, 1) if p is not None else None for p in (p50, p95, p99)),
+                    round(s.bytes / 1e6, 2),
+                    round(s.bytes_sent / 1e6, 2),
+                ])
+        return rows
+
+    def prometheus(self):
+        # Prometheus text exposition format: a latency histogram, an error counter and a byte counter per kind
+        lines = []
+        with self._lock:
+            for kind, description in KINDS.items():
+                series = sorted(self._series[kind].items())
+                metric = f"dashboard_{kind}"
+                lines += [f"# HELP {metric}_seconds {description}, latency", f"# TYPE {metric}_seconds histogram"]
+                for name, s in series:
+                    label = _label(name)
+                    cumulative = 0
+                    for bound, count in zip((*BUCKETS, "+Inf"), s.buckets):
+                        cumulative += count
+                        lines.append(f'{metric}_seconds_bucket{{name="{label}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{metric}_seconds_sum{{name="{label}"}} {s.seconds}')
+                    lines.append(f'{metric}_seconds_count{{name="{label}"}} {s.count}')
+                lines += [f"# HELP {metric}_errors_total {description}, failures", f"# TYPE {metric}_errors_total counter"]
+                lines += [f'{metric}_errors_total{{name="{_label(name)}"}} {s.errors}' for name, s in series]
+                if kind == "speckle":
+                    lines += [f"# HELP {metric}_bytes_total {description}, bytes received", f"# TYPE {metric}_bytes_total counter"]
+                    lines += [f'{metric}_bytes_total{{name="{_label(name)}"}} {s.bytes}' for name, s in series]
+                    lines += [f"# HELP {metric}_sent_bytes_total {description}, bytes sent", f"# TYPE {metric}_sent_bytes_total counter"]
+                    lines += [f'{metric}_sent_bytes_total{{name="{_label(name)}"}} {s.bytes_sent}' for name, s in series]
+        return "\n".join(lines) + "\n"
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Shared by every page, connection and script of the process
+registry = Registry()
+
+
+def timed(kind, name):
+    # `with timed("compute", "building analysis"): ...` records how long the block took
+    return registry.timed(kind, name)
+
+
+def speckle_call_name(method, url, payload=None):
+    # GraphQL requests by operation name, object transfers by endpoint
+    path = urlsplit(url).path
+    if path.endswith("/graphql"):
+        match = re.match(r"\s*(?:query|mutation)\s+(\w+)", (payload or {}).get("query", ""))
+        return f"graphql {match.group(1)}" if match else "graphql"
+    parts = path.strip("/").split("/")
+    if parts[:2] == ["api", "getobjects"]:
+        return "objects getobjects"
+    if parts[:2] == ["api", "diff"]:
+        return "objects diff"
+    if parts[0] == "objects":
+        return "objects single" if parts[-1] == "single" else f"objects {method.lower()}"
+    return f"{method} {path}"
+
+
+def _body_size(request):
+    # Bytes of a prepared request body, 0 when it is streamed
+    body = request.body if request is not None else None
+    return len(body) if isinstance(body, (bytes, str)) else 0
+
+
+def observed_request(request, method, url, **kwargs):
+    # Sends a request with `request` (a session's request method) and records it: latency
+    # (until the whole body is read), bytes received and bytes sent
+    name = speckle_call_name(method, url, kwargs.get("json"))
+    start = time.perf_counter()
+    try:
+        response = request(method, url, **kwargs)
+    except Exception:
+        registry.observe("speckle", name, time.perf_counter() - start, error=True)
+        raise
+    sent = _body_size(response.request)
+
+    if not kwargs.get("stream"):
+        registry.observe("speckle", name, time.perf_counter() - start, len(response.content), not response.ok, sent)
+        return response
+
+    # streamed bodies (object downloads) are counted as they are read
+    iter_content = response.iter_content
+
+    def counted(*args, **kwargs):
+        received = 0
+        try:
+            for chunk in iter_content(*args, **kwargs):
+                received += len(chunk)
+                yield chunk
+        finally:
+            registry.observe("speckle", name, time.perf_counter() - start, received, not response.ok, sent)
+
+    response.iter_content = counted
+    return response
+
+
+class InstrumentedSession(requests.Session):
+    # Records every request to the Speckle server
+    def request(self, method, url, **kwargs):
+        return observed_request(super().request, method, url, **kwargs)
+
+
+def instrument_session(session):
+    # Records the requests of a session created elsewhere (e.g. by specklepy's upload threads).
+    # Sessions already instrumented are returned as they are.
+    if not getattr(session, "instrumented", False):
+        request = session.request
+        session.request = lambda method, url, **kwargs: observed_request(request, method, url, **kwargs)
+        session.instrumented = True
+    return session
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    # Serves registry.prometheus() at /metrics in a background thread.
+    # Returns None (with a message) when the port is taken, e.g. by another page of the process.
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), Handler)
+    except OSError as ex:
+        print(f"Metrics endpoint not started on port {port}: {ex}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"Metrics at http://{host}:{port}/metrics")
+    return server
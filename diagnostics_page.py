@@ -0,0 +1,54 @@
+import functools
+import inspect
+
+import gradio as gr
+
+from diagnostics import registry
+
+HEADERS = ["Name", "Calls", "Errors", "Mean (ms)", "p50 (ms)", "p95 (ms)", "p99 (ms)", "MB received", "MB sent"]
+
+
+def _timed_handler(fn, name):
+    # Same signature (Gradio reads it) and same kind of function (plain or generator):
+    # generators are timed until their last update
+    if inspect.isgeneratorfunction(fn):
+        @functools.wraps(fn)
+        def handler(*args, **kwargs):
+            with registry.timed("callback", name):
+                yield from fn(*args, **kwargs)
+    else:
+        @functools.wraps(fn)
+        def handler(*args, **kwargs):
+            with registry.timed("callback", name):
+                return fn(*args, **kwargs)
+    handler.timed = True
+    return handler
+
+
+def instrument_handlers(blocks):
+    # Times every event handler of the app (rendered sub-pages included), named after
+    # the function and its event, e.g. "update_all (change)". Call it once the layout is built.
+    fns = blocks.fns.values() if isinstance(blocks.fns, dict) else blocks.fns
+    for block_fn in fns:
+        if block_fn.fn is None or getattr(block_fn.fn, "timed", False):
+            continue
+        events = sorted({event for _, event in block_fn.targets})
+        name = f"{block_fn.name} ({', '.join(events)})" if events else block_fn.name
+        block_fn.fn = _timed_handler(block_fn.fn, name)
+
+
+def diagnostics_tables():
+    return registry.rows("callback"), registry.rows("speckle"), registry.rows("compute"), registry.prometheus()
+
+
+def render_diagnostics():
+    # Contents of the "Diagnostics" tab: the measurements of this process, refreshed on demand.
+    # Percentiles cover the last 5 minutes, the other columns everything since the start.
+    gr.Markdown("Latency percentiles cover the last 5 minutes, calls, errors, means and MB everything since the server started. Speckle requests include object uploads (objects diff, objects post).")
+    refresh_button = gr.Button("Refresh")
+    callbacks = gr.Dataframe(headers=HEADERS, label="Event handlers", wrap=True)
+    speckle_calls = gr.Dataframe(headers=HEADERS, label="Speckle requests", wrap=True)
+    stages = gr.Dataframe(headers=HEADERS, label="Computation stages", wrap=True)
+    with gr.Accordion("Prometheus metrics", open=False):
+        prometheus = gr.Code(language=None, show_label=False)
+    refresh_button.click(fn=diagnostics_tables, outputs=[callbacks, speckle_calls, stages, prometheus])
@@ -0,0 +1,103 @@
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from types import SimpleNamespace
+
+from specklepy.api import operations
+from specklepy.transports.memory import MemoryTransport
+
+from version_fetcher import iter_versions, version_record
+
+
+class StageTimer:
+    # Wall-clock seconds spent in each named stage of a script (receive, transform, serialize, send...)
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0) + time.perf_counter() - start
+
+    def report(self):
+        return "\n".join(f"{name:>10}: {seconds:.3f}s" for name, seconds in self.timings.items())
+
+
+class OfflineProject:
+    # A project recorded in a fixture file (see record_fixture): its models, their versions
+    # (newest first) and every object they reference, held in a MemoryTransport. Scripts use it
+    # instead of the server to run their whole receive-transform-send path locally.
+    def __init__(self, path):
+        with open(path) as f:
+            fixture = json.load(f)
+        self.id = fixture["projectId"]
+        self.models = [SimpleNamespace(id=m["id"], name=m["name"]) for m in fixture["models"]]
+        self.versions = {
+            m["id"]: [
+                SimpleNamespace(
+                    id=v["versionId"],
+                    sourceApplication=v["sourceApplication"],
+                    authorUser=SimpleNamespace(name=v["authorName"]) if v["authorName"] else None,
+                    createdAt=datetime.fromisoformat(v["createdAt"]),
+                    message=v["message"],
+                    referencedObject=v["referencedObject"],
+                )
+                for v in m["versions"]
+            ]
+            for m in fixture["models"]
+        }
+        self.transport = MemoryTransport(name="Fixture")
+        self.transport.stream_id = self.id
+        self.transport.objects.update(fixture["objects"])
+        # what the scripts send ends up here
+        self.sent = MemoryTransport(name="DryRunOutput")
+        self.sent.stream_id = self.id
+
+    def get_model(self, model_id):
+        return next((m for m in self.models if m.id == model_id), None)
+
+    def latest_version(self, model_id):
+        versions = self.versions.get(model_id)
+        return versions[0] if versions else None
+
+    def latest_versions(self, models):
+        # Same records as BulkVersionFetcher.latest_versions
+        latest = [self.latest_version(m.id) for m in models]
+        return [version_record(v) if v else None for v in latest]
+
+    # Same as ObjectCache, so scripts can use the fixture in place of their object cache
+    def receive(self, object_id, transport=None):
+        return operations.receive(object_id, local_transport=self.transport)
+
+    def get_object(self, object_id):
+        return self.transport.get_object(object_id)
+
+    def stats(self):
+        return {"objects": len(self.transport.objects)}
+
+
+def record_fixture(path, client, transport, project_id, model_ids, versions_per_model=1):
+    # Writes a fixture file with the given models, their latest versions and every object
+    # referenced by them, received through `transport`
+    models = []
+    objects = {}
+    for model_id in model_ids:
+        model = client.model.get(model_id, project_id)
+        versions = []
+        for version in iter_versions(client, project_id, model_id, page_size=versions_per_model):
+            if len(versions) == versions_per_model:
+                break
+            record = version_record(version)
+            record["createdAt"] = record["createdAt"].isoformat()
+            versions.append(record)
+            local = MemoryTransport()
+            operations.receive(version.referencedObject, transport, local_transport=local)
+            objects.update(local.objects)
+        models.append({"id": model.id, "name": model.name, "versions": versions})
+
+    with open(path, "w") as f:
+        json.dump({"projectId": project_id, "models": models, "objects": objects}, f)
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from specklepy.objects import Base
+
+# Categories whose elements carry an area instead of a volume,
+# their volume is approximated as area * factor
+AREA_BASED_CATEGORIES = {
+    "@Windows": 70,
+}
+
+
+def _number(element, name):
+    value = getattr(element, name, None)
+    return value if isinstance(value, (int, float)) else np.nan
+
+
+def _element_members(base):
+    # Dynamic members holding elements, with their content as a list
+    for name in base.get_dynamic_member_names():
+        prop = base[name]
+        if isinstance(prop, Base):
+            prop = [prop]
+        if isinstance(prop, list):
+            yield name, [p for p in prop if isinstance(p, Base)]
+
+
+def element_columns(elements):
+    # Turns (category, element) pairs into columnar arrays, one entry per element
+    category, volume, area, density, carbon_factor = [], [], [], [], []
+    for name, element in elements:
+        category.append(name)
+        volume.append(_number(element, "volume"))
+        area.append(_number(element, "area"))
+        density.append(_number(element, "@density"))
+        carbon_factor.append(_number(element, "@embodied_carbon"))
+
+    return {
+        "category": np.array(category, dtype=object),
+        "volume": np.array(volume, dtype=np.float64),
+        "area": np.array(area, dtype=np.float64),
+        "density": np.array(density, dtype=np.float64),
+        "carbon_factor": np.array(carbon_factor, dtype=np.float64),
+    }
+
+
+def flatten_elements(base, categories=None):
+    # Columnar arrays of the elements of a Base object, one entry per element.
+    # Elements are Base objects found under the object's dynamic members (`@Walls`, `@Floors`...),
+    # the member name being the element's category.
+    return element_columns(
+        (name, element)
+        for name, elements in _element_members(base)
+        if categories is None or name in categories
+        for element in elements
+    )
+
+
+def aggregate_by_category(columns, area_based=AREA_BASED_CATEGORIES):
+    # Sums volume, mass and embodied carbon per category, missing values count as 0.
+    # Categories keep the order in which they first appear.
+    codes, categories = pd.factorize(columns["category"])
+    count = len(categories)
+
+    factors = np.array([area_based.get(c, np.nan) for c in categories], dtype=np.float64)
+    element_factors = factors[codes]
+    volume = np.where(np.isnan(element_factors), columns["volume"], columns["area"] * element_factors)
+    volume = np.nan_to_num(volume)
+    mass = volume * np.nan_to_num(columns["density"])
+    carbon = mass * np.nan_to_num(columns["carbon_factor"])
+
+    return {
+        "element": [c[1:] for c in categories],  # removing the prepending `@`
+        "volume": np.bincount(codes, weights=volume, minlength=count).tolist(),
+        "mass": np.bincount(codes, weights=mass, minlength=count).tolist(),
+        "embodied carbon": np.bincount(codes, weights=carbon, minlength=count).tolist(),
+    }
@@ -0,0 +1,208 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from graphql import (
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    InlineFragmentNode,
+    OperationDefinitionNode,
+    parse,
+)
+from graphql.utilities import value_from_ast_untyped
+
+# Server version reported to the clients (specklepy picks its queries from it)
+SERVER_VERSION = "2.23.0"
+# Date given to the projects and models of the fixtures
+FIXTURE_DATE = "2024-01-01T00:00:00.000Z"
+
+
+def _collection(items, limit=25, cursor=None, **kwargs):
+    # One page of a Speckle collection, the cursor being the offset of the next page
+    start = int(cursor) if cursor else 0
+    page = items[start:start + (limit or 0)]
+    end = start + len(page)
+    return {"totalCount": len(items), "cursor": str(end) if end < len(items) else None, "items": page}
+
+
+def _version(record):
+    return {
+        "id": record["versionId"],
+        "referencedObject": record["referencedObject"],
+        "message": record["message"],
+        "sourceApplication": record["sourceApplication"],
+        "createdAt": record["createdAt"],
+        "previewUrl": "",
+        "authorUser": {"id": record["authorName"], "name": record["authorName"], "avatar": None, "bio": None, "company": None, "role": None, "verified": True},
+    }
+
+
+def _model(model):
+    versions = [_version(v) for v in model["versions"]]
+    return {
+        "id": model["id"],
+        "name": model["name"],
+        "displayName": model["name"].rsplit("/", 1)[-1],
+        "description": None,
+        "createdAt": FIXTURE_DATE,
+        "updatedAt": versions[0]["createdAt"] if versions else FIXTURE_DATE,
+        "previewUrl": "",
+        "author": None,
+        "versions": lambda **kwargs: _collection(versions, **kwargs),
+    }
+
+
+def _project(fixture):
+    models = [_model(m) for m in fixture["models"]]
+    by_id = {m["id"]: m for m in models}
+    return {
+        "id": fixture["projectId"],
+        "name": fixture.get("name", fixture["projectId"]),
+        "description": None,
+        "visibility": "PUBLIC",
+        "allowPublicComments": True,
+        "role": "stream:owner",
+        "createdAt": FIXTURE_DATE,
+        "updatedAt": FIXTURE_DATE,
+        "sourceApps": sorted({v["sourceApplication"] for m in fixture["models"] for v in m["versions"]}),
+        "workspaceId": None,
+        "models": lambda **kwargs: _collection(models, **kwargs),
+        "model": lambda id, **kwargs: by_id.get(id),
+    }
+
+
+class FakeSpeckleServer:
+    # A local stand-in for a Speckle server, serving projects recorded as fixture files
+    # (see dry_run.record_fixture): GraphQL queries are answered from the fixtures, whatever
+    # fields they select, and objects are downloaded like from the real server.
+    # `latency` seconds are added to every request, the round trip to the real server.
+    def __init__(self, fixtures, host="127.0.0.1", port=0, latency=0.0):
+        self.latency = latency
+        self.projects = {f["projectId"]: _project(f) for f in fixtures}
+        self.objects = {f["projectId"]: f["objects"] for f in fixtures}
+        self.user = {"id": "load-test", "name": "Load Test", "email": "load-test@localhost", "avatar": None,
+                     "bio": None, "company": None, "role": "server:user", "verified": True}
+        self.server_info = {"name": "Fake Speckle Server", "company": None, "version": SERVER_VERSION,
+                            "canonicalUrl": None, "description": None}
+        self.requests = {"graphql": 0, "objects": 0}
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def host(self):
+        return f"{self._server.server_address[0]}:{self._server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="fake-speckle-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {**self.requests, "bytes_sent": self.bytes_sent}
+
+    def execute(self, query, variables=None):
+        # Resolves a GraphQL query against the fixtures: every selected field is read from
+        # the fixture data (missing ones are null), fields with arguments are functions
+        document = parse(query)
+        fragments = {d.name.value: d for d in document.definitions if isinstance(d, FragmentDefinitionNode)}
+        operation = next(d for d in document.definitions if isinstance(d, OperationDefinitionNode))
+        root = {
+            "project": lambda id, **kwargs: self.projects.get(id),
+            "activeUser": self.user,
+            "serverInfo": self.server_info,
+        }
+        return {"data": self._resolve(root, operation.selection_set, variables or {}, fragments)}
+
+    def _resolve(self, value, selection_set, variables, fragments):
+        if value is None:
+            return None
+        if isinstance(value, list):
+            return [self._resolve(item, selection_set, variables, fragments) for item in value]
+        result = {}
+        for selection in selection_set.selections:
+            if isinstance(selection, FragmentSpreadNode):
+                result.update(self._resolve(value, fragments[selection.name.value].selection_set, variables, fragments))
+            elif isinstance(selection, InlineFragmentNode):
+                result.update(self._resolve(value, selection.selection_set, variables, fragments))
+            elif isinstance(selection, FieldNode):
+                name = selection.name.value
+                field = value.get(name)
+                if callable(field):
+                    args = {arg.name.value: value_from_ast_untyped(arg.value, variables) for arg in selection.arguments}
+                    field = field(**args)
+                if selection.selection_set is not None:
+                    field = self._resolve(field, selection.selection_set, variables, fragments)
+                result[selection.alias.value if selection.alias else name] = field
+        return result
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, status, body, content_type="application/json"):
+                body = body.encode() if isinstance(body, str) else body
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with server._lock:
+                    server.bytes_sent += len(body)
+
+            def _body(self):
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def do_GET(self):
+                time.sleep(server.latency)
+                # /objects/{projectId}/{objectId}/single: the root object only
+                parts = self.path.strip("/").split("/")
+                if len(parts) == 4 and parts[0] == "objects" and parts[3] == "single":
+                    with server._lock:
+                        server.requests["objects"] += 1
+                    content = server.objects.get(parts[1], {}).get(parts[2])
+                    if content is None:
+                        return self._send(404, "Object not found", "text/plain")
+                    return self._send(200, content)
+                self._send(404, "Not found", "text/plain")
+
+            def do_POST(self):
+                time.sleep(server.latency)
+                body = self._body()
+                if self.path.rstrip("/") == "/graphql":
+                    with server._lock:
+                        server.requests["graphql"] += 1
+                    request = json.loads(body)
+                    try:
+                        response = server.execute(request["query"], request.get("variables"))
+                    except Exception as ex:
+                        response = {"errors": [{"message": str(ex)}], "data": None}
+                    return self._send(200, json.dumps(response))
+                # /api/getobjects/{projectId}: the children of a root object, one "id\tobject" line each
+                parts = self.path.strip("/").split("/")
+                if len(parts) == 3 and parts[:2] == ["api", "getobjects"]:
+                    with server._lock:
+                        server.requests["objects"] += 1
+                    if self.headers.get("Content-Type", "").startswith("application/json"):
+                        ids = json.loads(json.loads(body)["objects"])
+                    else:
+                        ids = json.loads(parse_qs(body.decode())["objects"][0])
+                    objects = server.objects.get(parts[2], {})
+                    lines = "".join(f"{id}\t{objects[id]}\n" for id in ids if id in objects)
+                    return self._send(200, lines, "text/plain")
+                self._send(404, "Not found", "text/plain")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,80 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from specklepy.serialization.base_object_serializer import hash_obj
+
+# Type of the object wrapping the federated models
+FEDERATION_TYPE = "Federation.Granular"
+# What was federated last time, per branch
+FEDERATION_MANIFEST_PATH = "federation_manifest.json"
+
+
+def fetch_closures(transport, object_ids, cache=None, max_workers=4):
+    # Closure ({child id: depth}) of every object by id, read from its root object only (not
+    # its children), taken from the local object cache when it has it, otherwise downloaded
+    def fetch(object_id):
+        content = cache.get_object(object_id) if cache is not None else None
+        if content is None:
+            response = transport.session.get(f"{transport.url}/objects/{transport.stream_id}/{object_id}/single")
+            response.raise_for_status()
+            content = response.text
+        return object_id, json.loads(content).get("__closure", {})
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return dict(pool.map(fetch, object_ids))
+
+
+def reference_federation(closures, member="@Components", speckle_type=FEDERATION_TYPE):
+    # Serializes a wrapper object whose `member` list holds detached references to objects
+    # that are already on the server, instead of the objects themselves. Its closure lists
+    # every object below the references (from `closures`, {object id: closure}), so viewers
+    # and receives load the whole federated model. Returns (id, serialized wrapper).
+    closure = {}
+    for object_id, object_closure in closures.items():
+        closure[object_id] = 1
+        for child_id, depth in object_closure.items():
+            closure[child_id] = min(closure.get(child_id, depth + 1), depth + 1)
+
+    wrapper = {
+        "speckle_type": speckle_type,
+        "applicationId": None,
+        member: [{"referencedId": object_id, "speckle_type": "reference"} for object_id in closures],
+        "totalChildrenCount": len(closure),
+    }
+    wrapper["id"] = hash_obj(wrapper)
+    wrapper["__closure"] = closure
+    return wrapper["id"], json.dumps(wrapper)
+
+
+def send_objects(transport, objects):
+    # Uploads already serialized objects ({id: serialized object}) as they are
+    transport.begin_write()
+    for object_id, content in objects.items():
+        transport.save_object(object_id, content)
+    transport.end_write()
+
+
+def load_manifest(path=FEDERATION_MANIFEST_PATH):
+    # {"projectId", "modelId", "objectId": last federated object,
+    #  "branches": {branch name: {"referencedObject", "closure"}}}
+    if not os.path.exists(path):
+        return {"projectId": None, "modelId": None, "objectId": None, "branches": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=FEDERATION_MANIFEST_PATH):
+    # Written to a temporary file first, an interrupted run never leaves half a manifest
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+
+def changed_branches(manifest, heads):
+    # Names of the branches whose head ({branch name: referencedObject}) moved since the
+    # manifest was written (new branches included), and of the branches no longer federated
+    previous = manifest["branches"]
+    changed = [name for name, object_id in heads.items() if previous.get(name, {}).get("referencedObject") != object_id]
+    removed = [name for name in previous if name not in heads]
+    return changed, removed
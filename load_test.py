@@ -0,0 +1,298 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+import numpy as np
+from gradio_client import Client
+
+from fake_speckle_server import FakeSpeckleServer
+from object_upload import serialize_objects
+from synthetic_models import synthetic_model, synthetic_versions
+
+# Run with `python load_test.py speckle_insights.py --users 30 --duration 60`: starts a local stand-in
+# Speckle server with the fixtures, starts the app against it, and has every simulated user open the
+# page and drive its dropdowns through the Gradio API like a browser would, as fast as answers come back.
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Projects and models the pages open (building_analysis.model_map, speckle_insights.project_id)
+BUILDING_MODELS = {
+    "farnsworth house": ("d3e86261bf", "3a724a3d22"),
+    "kunsthaus zurich": ("daeb18ed0a", "aab87740df"),
+}
+INSIGHTS_PROJECT_ID = "28a211b286"
+TEAMS = ["Residential", "Structure", "Service", "Facade", "Industrial", "Data"]
+RESIDENTIAL_MODELS = [
+    "residential/shared/unit_exterior_walls",
+    "residential/shared/units_best_views",
+    "residential/shared/units_sun_hours",
+]
+
+# Seconds to wait for an app to serve its page
+STARTUP_TIMEOUT = 180
+# Share of failed calls of any callback above which the run fails (exit code 1)
+MAX_ERROR_RATE = 0.01
+
+
+def building_page(call, rng):
+    call("demo.load", "/update_all", "kunsthaus zurich", False)
+
+
+def building_actions(call, rng):
+    model_name = str(rng.choice(list(BUILDING_MODELS)))
+    call("model_dropdown.change", "/update_all_1", model_name, False)
+    call("full_resolution.change", "/update_scatter", model_name, bool(rng.integers(2)))
+
+
+def insights_page(call, rng):
+    # The page loads fill the model dropdowns of the user's session. The residential page is
+    # rendered before the insights page registers its own load, so it has the unsuffixed name.
+    call("residential demo.load", "/initialize_app")
+    call("demo.load", "/initialize_app_1")
+
+
+def insights_actions(call, rng):
+    dropdown = call("team_dropdown.change", "/update_model_selection_by_team", str(rng.choice(TEAMS)))
+    # the dropdown update comes back whole, the user keeps the model it selects
+    model_name = dropdown.get("value") if isinstance(dropdown, dict) else dropdown
+    if model_name:
+        call("model_dropdown.change", "/create_viewer_url", model_name)
+    call("residential model_dropdown.change", "/handle_model_change", str(rng.choice(RESIDENTIAL_MODELS)))
+
+
+# What a user does on each app: once when opening the page, then in a loop
+APPS = {
+    "building_analysis.py": (building_page, building_actions),
+    "speckle_insights.py": (insights_page, insights_actions),
+}
+
+
+def _iso(record):
+    return {**record, "createdAt": record["createdAt"].isoformat()}
+
+
+def synthetic_fixtures(elements=5000, models_per_team=4, versions=200):
+    # Fixtures (see dry_run.record_fixture) of every project the apps open, with synthetic
+    # building models and version histories
+    fixtures = []
+    for seed, (project_id, model_id) in enumerate(BUILDING_MODELS.values()):
+        root_id, objects = serialize_objects(synthetic_model(elements, seed=seed))
+        version = {"versionId": f"{model_id}v0", "sourceApplication": "Rhino", "authorName": "load test",
+                   "createdAt": datetime(2026, 1, 1, tzinfo=timezone.utc), "message": "synthetic model",
+                   "referencedObject": root_id}
+        fixtures.append({"projectId": project_id, "models": [{"id": model_id, "name": "main", "versions": [_iso(version)]}], "objects": objects})
+
+    names = RESIDENTIAL_MODELS + [f"{team.lower()}/model {i}" for team in TEAMS for i in range(models_per_team)]
+    models, histories = synthetic_versions(models=len(names), versions=versions)
+    fixtures.append({
+        "projectId": INSIGHTS_PROJECT_ID,
+        "models": [{"id": m.id, "name": name, "versions": [_iso(v) for v in history]}
+                   for m, name, history in zip(models, names, histories)],
+        "objects": {},
+    })
+    return fixtures
+
+
+def synthetic_sheet(path, rows=8):
+    # The residential sheet: one row per unit type, then the two total rows the page leaves out
+    lines = ["Unit type,Updated quantity (u),Updated Area (m2),Updated Population"]
+    lines += [f"type {i},{10 + i},{(10 + i) * 45},{(10 + i) * 2}" for i in range(rows)]
+    lines += ["Total,0,0,0", "Check,0,0,0"]
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(app, server, sheet, workdir):
+    # The app as a separate process, talking to the stand-in server, with fresh local caches.
+    # Returns the process, the page URL and the URL of its Prometheus metrics.
+    port = free_port()
+    metrics_port = free_port()
+    env = {
+        **os.environ,
+        "SPECKLE_SERVER": server.host,
+        "SPECKLE_USE_SSL": "0",
+        "SPECKLE_TOKEN": "load-test",
+        "RESIDENTIAL_SHEET_SOURCE": sheet,
+        "GRADIO_SERVER_NAME": "127.0.0.1",
+        "GRADIO_SERVER_PORT": str(port),
+        "GRADIO_ANALYTICS_ENABLED": "False",
+        "METRICS_PORT": str(metrics_port),
+    }
+    log = open(os.path.join(workdir, "app.log"), "w")
+    process = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, app)], cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}/"
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{app} exited with code {process.returncode}, see {log.name}")
+        try:
+            urllib.request.urlopen(url, timeout=5)
+            return process, url, f"http://127.0.0.1:{metrics_port}/metrics"
+        except OSError:
+            time.sleep(0.5)
+    process.kill()
+    raise RuntimeError(f"{app} did not start within {STARTUP_TIMEOUT}s, see {log.name}")
+
+
+def percentiles(latencies):
+    if not latencies:
+        return {"p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+def run_users(url, app, users, duration, seed=0):
+    # `users` simulated users, each with its own Gradio session, repeating the app's actions
+    # until `duration` seconds are over. Returns every call as (callback, seconds, error).
+    open_page, actions = APPS[app]
+    calls = []
+    calls_lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def user(index):
+        rng = np.random.default_rng(seed + index)
+        client = Client(url, verbose=False)
+
+        def call(callback, api_name, *inputs):
+            start = time.perf_counter()
+            error = None
+            try:
+                return client.predict(*inputs, api_name=api_name)
+            except Exception as ex:
+                error = f"{type(ex).__name__}: {ex}"
+            finally:
+                with calls_lock:
+                    calls.append((callback, time.perf_counter() - start, error))
+
+        open_page(call, rng)
+        while True:
+            actions(call, rng)
+            if time.monotonic() >= deadline:
+                return
+
+    threads = [threading.Thread(target=user, args=(i,), name=f"user-{i}") for i in range(users)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return calls, time.monotonic() - start
+
+
+def report(calls, elapsed):
+    # Latency percentiles and throughput per callback
+    callbacks = {}
+    for callback, seconds, error in calls:
+        entry = callbacks.setdefault(callback, {"latencies": [], "errors": []})
+        if error is None:
+            entry["latencies"].append(seconds)
+        else:
+            entry["errors"].append(error)
+
+    result = {}
+    for callback, entry in callbacks.items():
+        result[callback] = {
+            "calls": len(entry["latencies"]) + len(entry["errors"]),
+            "errors": len(entry["errors"]),
+            **percentiles(entry["latencies"]),
+            "mean": float(np.mean(entry["latencies"])) if entry["latencies"] else None,
+            "max": max(entry["latencies"], default=None),
+            "throughput": len(entry["latencies"]) / elapsed,
+            "first_error": entry["errors"][0] if entry["errors"] else None,
+        }
+    return result
+
+
+def failed_callbacks(results, max_error_rate=MAX_ERROR_RATE):
+    # Callbacks whose share of failed calls is above `max_error_rate`: their latencies don't measure the app
+    return [callback for callback, r in results.items() if r["errors"] > max_error_rate * r["calls"]]
+
+
+def print_report(results):
+    print(f"{'callback':<36} {'calls':>6} {'errors':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>7}")
+    for callback, r in results.items():
+        p50, p95, p99 = (f"{r[p]:>8.3f}" if r[p] is not None else f"{'-':>8}" for p in ("p50", "p95", "p99"))
+        print(f"{callback:<36} {r['calls']:>6} {r['errors']:>6} {p50} {p95} {p99} {r['throughput']:>7.2f}")
+        if r["first_error"]:
+            print(f"    first error: {r['first_error'][:200]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent users on a dashboard served against a local stand-in Speckle server")
+    parser.add_argument("app", choices=list(APPS))
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=60, help="seconds of load")
+    parser.add_argument("--fixtures", nargs="+", help="recorded fixtures (dry_run.record_fixture), synthetic projects when not given")
+    parser.add_argument("--sheet", help="residential sheet CSV, a synthetic one when not given")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every Speckle request")
+    parser.add_argument("--elements", type=int, default=5000, help="elements of the synthetic building models")
+    parser.add_argument("--workdir", help="where the app keeps its caches and log, a new temporary directory when not given")
+    parser.add_argument("--max-error-rate", type=float, default=MAX_ERROR_RATE, help="share of failed calls of a callback that fails the run")
+    parser.add_argument("--output", help="JSON file of the results")
+    args = parser.parse_args()
+
+    if args.fixtures:
+        fixtures = []
+        for path in args.fixtures:
+            with open(path) as f:
+                fixtures.append(json.load(f))
+    else:
+        fixtures = synthetic_fixtures(args.elements)
+    # the app runs in the work directory, paths given to it must not be relative to here
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="load_test_"))
+    os.makedirs(workdir, exist_ok=True)
+    sheet = os.path.abspath(args.sheet) if args.sheet else None
+    if sheet is None:
+        sheet = os.path.join(workdir, "sheet.csv")
+        synthetic_sheet(sheet)
+
+    server = FakeSpeckleServer(fixtures, latency=args.latency).start()
+    process, url, metrics_url = start_app(args.app, server, sheet, workdir)
+    try:
+        # one user first, not measured: the app loads its data and fills its caches.
+        # When it fails, so would every user, and the run would measure nothing.
+        warmup_calls, _ = run_users(url, args.app, 1, 0)
+        if not warmup_calls:
+            raise SystemExit(f"The warm-up user made no call, see {os.path.join(workdir, 'app.log')}")
+        for callback, _, error in warmup_calls:
+            if error is not None:
+                raise SystemExit(f"The warm-up user failed on {callback}: {error[:1000]}\nSee {os.path.join(workdir, 'app.log')}")
+        server_before = server.stats()
+        calls, elapsed = run_users(url, args.app, args.users, args.duration)
+        results = report(calls, elapsed)
+        server_after = server.stats()
+        # the app's own breakdown: handlers, Speckle requests and computation stages
+        metrics_path = os.path.join(workdir, "metrics.prom")
+        with urllib.request.urlopen(metrics_url, timeout=10) as response, open(metrics_path, "wb") as f:
+            f.write(response.read())
+    finally:
+        process.terminate()
+        process.wait()
+        server.stop()
+
+    print_report(results)
+    speckle = {name: server_after[name] - server_before[name] for name in server_after}
+    print(f"{args.users} users for {elapsed:.1f}s, Speckle server: {speckle}")
+    print(f"App metrics: {metrics_path}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"app": args.app, "users": args.users, "duration": elapsed, "latency": args.latency,
+                       "callbacks": results, "speckle": speckle}, f, indent=2)
+    failed = failed_callbacks(results, args.max_error_rate)
+    if failed:
+        print(f"Failed: more than {args.max_error_rate:.0%} of the calls of {', '.join(failed)} returned errors")
+        sys.exit(1)
@@ -0,0 +1,86 @@
+from itertools import chain
+from operator import attrgetter
+
+import numpy as np
+from specklepy.objects import Base
+
+_point_coordinates = attrgetter("x", "y", "z")
+
+
+def _vertex_buffers(element):
+    # Yields the flat [x, y, z, x, y, z, ...] vertex buffers of an element
+    points = getattr(element, "Vertices", None)
+    if isinstance(points, list) and points:
+        if isinstance(points[0], (int, float)):
+            yield points
+        else:
+            # point objects are read straight into a float32 buffer, without a list of coordinates
+            coordinates = chain.from_iterable(map(_point_coordinates, points))
+            yield np.fromiter(coordinates, dtype=np.float32, count=3 * len(points))
+    vertices = getattr(element, "vertices", None)
+    if isinstance(vertices, list) and vertices:
+        yield vertices
+    display_value = getattr(element, "displayValue", None)
+    if isinstance(display_value, Base):
+        display_value = [display_value]
+    if isinstance(display_value, list):
+        for mesh in display_value:
+            vertices = getattr(mesh, "vertices", None)
+            if isinstance(vertices, list) and vertices:
+                yield vertices
+
+
+def extract_vertices(base):
+    # Collects the vertices of every element under the object's dynamic members into
+    # one contiguous (n, 3) float32 array, with the element category of each vertex
+    # stored as a small integer code into `categories`
+    buffers, codes, categories = [], [], []
+    for name in base.get_dynamic_member_names():
+        prop = base[name]
+        elements = [prop] if isinstance(prop, Base) else prop
+        if not isinstance(elements, list):
+            continue
+        code = len(categories)
+        count = 0
+        for element in elements:
+            if not isinstance(element, Base):
+                continue
+            for buffer in _vertex_buffers(element):
+                xyz = np.asarray(buffer, dtype=np.float32).reshape(-1, 3)
+                buffers.append(xyz)
+                count += len(xyz)
+        if count:
+            categories.append(name[1:])  # removing the prepending `@`
+            codes.append(np.full(count, code, dtype=np.int16))
+
+    return {
+        "xyz": np.concatenate(buffers) if buffers else np.empty((0, 3), dtype=np.float32),
+        "element": np.concatenate(codes) if codes else np.empty(0, dtype=np.int16),
+        "categories": categories,
+    }
+
+
+def decimate_vertices(vertices, budget, min_per_category=200):
+    # Stratified downsampling to at most `budget` points (give or take the per-category
+    # minimum). Every category gets a share proportional to its size but never less than
+    # `min_per_category` points, so small elements stay visible next to large ones.
+    # Points are picked at an even stride, which keeps their spatial spread.
+    codes = vertices["element"]
+    total = len(codes)
+    if total <= budget:
+        return vertices
+
+    keep = []
+    for code in range(len(vertices["categories"])):
+        indices = np.flatnonzero(codes == code)
+        share = max(int(budget * len(indices) / total), min_per_category)
+        if len(indices) > share:
+            indices = indices[np.linspace(0, len(indices) - 1, share).astype(np.int64)]
+        keep.append(indices)
+    keep = np.sort(np.concatenate(keep))
+
+    return {
+        "xyz": vertices["xyz"][keep],
+        "element": codes[keep],
+        "categories": vertices["categories"],
+    }
@@ -0,0 +1,183 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from specklepy.api import operations
+from specklepy.logging.exceptions import SpeckleException
+from specklepy.transports.abstract_transport import AbstractTransport
+
+# Local database holding received Speckle objects
+OBJECT_CACHE_PATH = "speckle_objects.db"
+# Size above which the least recently received models are evicted
+MAX_CACHE_SIZE_MB = 1024
+
+
+class ObjectCache(AbstractTransport):
+    # On-disk cache for Speckle objects. Object ids are content hashes, so a cached
+    # object never goes stale and never needs invalidation. Objects are grouped by
+    # the root they were received with; when the cache grows over its size cap the
+    # least recently used roots are evicted together with the children no other
+    # root shares, so a cached root always has all of its children.
+    def __init__(self, path=OBJECT_CACHE_PATH, max_size_mb=MAX_CACHE_SIZE_MB, name="ObjectCache"):
+        super().__init__()
+        self._name = name
+        self.path = path
+        self.max_size = int(max_size_mb * 1000 * 1000)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+        # write batches are per thread, several receives can fill the cache at once
+        self._local = threading.local()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode='wal';")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS objects (
+                    id TEXT PRIMARY KEY,
+                    content TEXT NOT NULL,
+                    size INTEGER NOT NULL
+                ) WITHOUT ROWID"""
+            )
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS roots (
+                    id TEXT PRIMARY KEY,
+                    lastAccess REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS members (
+                    root TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    PRIMARY KEY (root, id)
+                ) WITHOUT ROWID"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS members_id ON members(id)")
+        self.size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def __repr__(self) -> str:
+        return f"ObjectCache(path: '{self.path}', size: {self.size / 1e6:.1f}MB, hits: {self.hits}, misses: {self.misses})"
+
+    def receive(self, obj_id, remote_transport):
+        # Receives an object through the cache, only going to the server on a miss
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT content FROM objects WHERE id = ?", (obj_id,)).fetchone()
+            if row:
+                self.hits += 1
+                self._register_root(obj_id, row[0])
+            else:
+                self.misses += 1
+        return operations.receive(obj_id, remote_transport, local_transport=self)
+
+    def stats(self):
+        with self._lock:
+            objects, roots = self._conn.execute("SELECT (SELECT COUNT(*) FROM objects), (SELECT COUNT(*) FROM roots)").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "objects": objects,
+            "roots": roots,
+            "size_mb": round(self.size / 1e6, 2),
+        }
+
+    def begin_write(self) -> None:
+        self._local.batch = []
+
+    def save_object(self, id: str, serialized_object: str) -> None:
+        if getattr(self._local, "batch", None) is None:
+            self._local.batch = []
+        self._local.batch.append((id, serialized_object))
+
+    def save_object_from_transport(self, id: str, source_transport: AbstractTransport) -> None:
+        self.save_object(id, source_transport.get_object(id))
+
+    def end_write(self) -> None:
+        batch = getattr(self._local, "batch", None) or []
+        self._local.batch = None
+        if not batch:
+            return
+        # the server transport saves the requested root last, after its children
+        root_id, root_content = batch[-1]
+        with self._lock, self._conn:
+            for id, content in batch:
+                inserted = self._conn.execute(
+                    "INSERT OR IGNORE INTO objects VALUES (?, ?, ?)", (id, content, len(content))
+                ).rowcount
+                if inserted:
+                    self.size += len(content)
+            self._register_root(root_id, root_content)
+            self._evict(keep=root_id)
+
+    def get_object(self, id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT content FROM objects WHERE id = ?", (id,)).fetchone()
+        return row[0] if row else None
+
+    def has_objects(self, id_list: List[str]) -> Dict[str, bool]:
+        found = set()
+        with self._lock:
+            for start in range(0, len(id_list), 500):
+                chunk = id_list[start:start + 500]
+                placeholders = ", ".join("?" for _ in chunk)
+                rows = self._conn.execute(f"SELECT id FROM objects WHERE id IN ({placeholders})", chunk).fetchall()
+                found.update(row[0] for row in rows)
+        return {id: id in found for id in id_list}
+
+    def copy_object_and_children(self, id: str, target_transport: AbstractTransport) -> str:
+        # Like the server transport: the children in the root's __closure the target doesn't
+        # have yet, then the root itself, last. A cached root always has all of its children.
+        root = self.get_object(id)
+        if root is None:
+            raise SpeckleException(f"Object {id} is not in {self.name}")
+        found = target_transport.has_objects(list(json.loads(root).get("__closure", {})))
+        target_transport.begin_write()
+        for child_id in (child_id for child_id, has in found.items() if not has):
+            child = self.get_object(child_id)
+            if child is None:
+                raise SpeckleException(f"Child {child_id} of object {id} is not in {self.name}")
+            target_transport.save_object(child_id, child)
+        target_transport.save_object(id, root)
+        target_transport.end_write()
+        return root
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _register_root(self, root_id, root_content):
+        # Marks the object as recently used, recording which objects belong to it
+        # the first time it is seen as a root
+        known = self._conn.execute("SELECT 1 FROM roots WHERE id = ?", (root_id,)).fetchone()
+        if not known:
+            closure = json.loads(root_content).get("__closure", {})
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO members VALUES (?, ?)",
+                [(root_id, root_id)] + [(root_id, id) for id in closure],
+            )
+        self._conn.execute(
+            "INSERT INTO roots VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET lastAccess = excluded.lastAccess",
+            (root_id, time.time()),
+        )
+
+    def _evict(self, keep):
+        while self.size > self.max_size:
+            row = self._conn.execute(
+                "SELECT id FROM roots WHERE id != ? ORDER BY lastAccess LIMIT 1", (keep,)
+            ).fetchone()
+            if row is None:
+                return
+            root_id = row[0]
+            exclusive = "id IN (SELECT id FROM members WHERE root = ?) AND id NOT IN (SELECT id FROM members WHERE root != ?)"
+            freed = self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM objects WHERE {exclusive}", (root_id, root_id)).fetchone()[0]
+            self._conn.execute(f"DELETE FROM objects WHERE {exclusive}", (root_id, root_id))
+            self._conn.execute("DELETE FROM members WHERE root = ?", (root_id,))
+            self._conn.execute("DELETE FROM roots WHERE id = ?", (root_id,))
+            self.size -= freed
+            self.evictions += 1
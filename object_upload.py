@@ -0,0 +1,89 @@
+import json
+import sqlite3
+import threading
+
+from specklepy.api import operations
+from specklepy.transports.memory import MemoryTransport
+
+from federation import send_objects
+from speckle_connection import SPECKLE_SERVER
+
+# Local database of the object ids each server is known to have, per project
+SERVER_INDEX_PATH = "speckle_server_objects.db"
+
+
+class ServerObjectIndex:
+    # Ids of objects known to exist on `server`, per project: everything received from
+    # it and everything sent to it. Object ids are content hashes, so an object in the
+    # index never has to be uploaded again. Rows are keyed by server too: the same file used
+    # against another server (SPECKLE_SERVER) with the same project id knows none of its objects.
+    def __init__(self, path=SERVER_INDEX_PATH, server=SPECKLE_SERVER):
+        self.path = path
+        self.server = server
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            # the earlier table didn't say which server its objects are on
+            self._conn.execute("DROP TABLE IF EXISTS objects")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS server_objects (
+                    server TEXT NOT NULL,
+                    projectId TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    PRIMARY KEY (server, projectId, id)
+                ) WITHOUT ROWID"""
+            )
+
+    def known(self, project_id, ids):
+        # The subset of `ids` the server has
+        found = set()
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ", ".join("?" for _ in chunk)
+                rows = self._conn.execute(
+                    f"SELECT id FROM server_objects WHERE server = ? AND projectId = ? AND id IN ({placeholders})",
+                    [self.server, project_id, *chunk],
+                ).fetchall()
+                found.update(row[0] for row in rows)
+        return found
+
+    def add(self, project_id, ids):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO server_objects VALUES (?, ?, ?)", [(self.server, project_id, id) for id in ids]
+            )
+
+    def add_tree(self, project_id, root_id, root_content):
+        # A root object and all of its children, from the closure of the serialized root
+        self.add(project_id, [root_id, *json.loads(root_content).get("__closure", {})])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def serialize_objects(base):
+    # Serializes `base` locally: its id and every object of the tree ({id: serialized object}),
+    # children before their parents
+    serialized = MemoryTransport()
+    root_id = operations.send(base=base, transports=[serialized], use_default_cache=False)
+    return root_id, serialized.objects
+
+
+def upload_new(objects, transport, index):
+    # Uploads the serialized objects the index doesn't know, in the transport's batched
+    # requests. Returns how many objects and bytes were sent and skipped.
+    project_id = transport.stream_id
+    known = index.known(project_id, list(objects))
+    new = {id: content for id, content in objects.items() if id not in known}
+    if new:
+        send_objects(transport, new)
+        index.add(project_id, list(new))
+
+    return {
+        "objects_sent": len(new),
+        "objects_skipped": len(known),
+        "bytes_sent": sum(len(content) for content in new.values()),
+        "bytes_skipped": sum(len(objects[id]) for id in known),
+    }
@@ -0,0 +1,38 @@
+import pandas as pd
+
+from version_fetcher import BulkVersionFetcher
+from version_store import VersionStore
+
+
+# Columns kept for every version in the snapshot
+VERSION_COLUMNS = ["modelId", "modelName", "versionId", "sourceApplication", "authorName", "createdAt", "message", "referencedObject"]
+
+
+class ProjectSnapshot:
+    # Brings the local version store up to date (only new versions are downloaded)
+    # and reads the project's whole history from it, so all the dashboard
+    # statistics, charts and the timeline are computed from the same data
+    def __init__(self, client, project, fetcher=None, store=None):
+        self.project = project
+        self.models = project.models.items
+
+        if fetcher is None:
+            fetcher = BulkVersionFetcher(client)
+        if store is None:
+            store = VersionStore()
+        self.new_versions = store.sync(fetcher, project.id, self.models)
+
+        versions = store.versions_frame([m.id for m in self.models])
+        model_names = {m.id: m.name for m in self.models}
+        versions["modelName"] = versions["modelId"].map(model_names)
+        self.versions = versions[VERSION_COLUMNS]
+
+    def commit_counts(self):
+        # Number of versions per model, including models without any version
+        counts = self.versions.groupby("modelName").size()
+        return pd.Series({m.name: int(counts.get(m.name, 0)) for m in self.models}, name="totalCommits")
+
+    def latest_version_id(self, model_id):
+        # Versions are ordered newest first
+        ids = self.versions.loc[self.versions["modelId"] == model_id, "versionId"]
+        return ids.iloc[0] if len(ids) else None
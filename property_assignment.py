@@ -0,0 +1,79 @@
+import json
+from collections import Counter
+
+import pandas as pd
+from specklepy.objects import Base
+
+# Material table used by addPropertiesToSpeckleModel.py: one row per element category
+MATERIALS_TABLE_PATH = "materials.csv"
+# Properties written on every element of a category, from the table columns of the same name
+ASSIGNED_PROPERTIES = ["material", "density", "embodied_carbon"]
+
+
+def load_material_table(path=MATERIALS_TABLE_PATH):
+    # {category: {"@material": ..., "@density": ..., "@embodied_carbon": ...}} from a CSV file
+    # (columns: category, material, density, embodied_carbon) or a JSON file ({category: {material, ...}}).
+    # Categories are the element member names, with or without their leading `@`.
+    if path.endswith(".json"):
+        with open(path) as f:
+            rows = json.load(f)
+    else:
+        rows = pd.read_csv(path).set_index("category").to_dict(orient="index")
+    return {
+        category.lstrip("@"): {f"@{prop}": values[prop] for prop in ASSIGNED_PROPERTIES}
+        for category, values in rows.items()
+    }
+
+
+def _child_members(base):
+    # Dynamic members holding child objects: detached members (`@Walls`, `@{0}`, `@Building`...) and `elements`
+    for name in base.get_dynamic_member_names():
+        if not (name.startswith("@") or name == "elements"):
+            continue
+        value = base[name]
+        if isinstance(value, Base):
+            yield name, [value]
+        elif isinstance(value, list):
+            children = [v for v in value if isinstance(v, Base)]
+            if children:
+                yield name, children
+
+
+def walk_elements(root):
+    # Every object of the tree below `root` once, with the member name it was found under
+    # (its category, without the leading `@`). Depth-first, without recursion, so any
+    # number of buildings and levels can be nested.
+    seen = {id(root)}
+    stack = [root]
+    while stack:
+        base = stack.pop()
+        for name, children in _child_members(base):
+            category = name.lstrip("@")
+            for child in children:
+                if id(child) in seen:
+                    continue
+                seen.add(id(child))
+                stack.append(child)
+                yield category, child
+
+
+def assign_properties(root, table):
+    # Writes the table properties on every element of the whole tree whose category is in
+    # the table, in one pass. Elements of other categories without any child objects
+    # (so not buildings, levels or other containers) are reported as unmatched.
+    assigned = Counter()
+    unmatched = Counter()
+    for category, element in walk_elements(root):
+        values = table.get(category)
+        if values is not None:
+            for name, value in values.items():
+                element[name] = value
+            assigned[category] += 1
+        elif next(_child_members(element), None) is None:
+            unmatched[category] += 1
+    return {
+        "assigned": sum(assigned.values()),
+        "unmatched": sum(unmatched.values()),
+        "assigned_categories": dict(assigned),
+        "unmatched_categories": dict(unmatched),
+    }
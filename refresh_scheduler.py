@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+# A complete result of the build function with when it finished and how long it took
+Refresh = namedtuple("Refresh", ["value", "generation", "finished_at", "duration"])
+
+
+class RefreshScheduler:
+    # Rebuilds a value on an interval in a background thread. The new value is swapped in
+    # only once it is complete (one reference assignment), so readers always get a whole
+    # result, either the previous one or the new one, and never wait for a rebuild.
+    # A failed rebuild keeps the previous value and is reported by `status()`.
+    def __init__(self, build, interval, name="refresh-scheduler"):
+        self.latest = Refresh(None, 0, None, None)
+        self.error = None
+        self.interval = interval
+        self._build = build
+        self._refreshing = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    @property
+    def value(self):
+        return self.latest.value
+
+    @property
+    def generation(self):
+        return self.latest.generation
+
+    def refresh(self, *args):
+        # Builds and swaps in a new value right away, returns it
+        with self._refreshing:
+            start = time.perf_counter()
+            value = self._build(*args)
+            duration = time.perf_counter() - start
+            self.latest = Refresh(value, self.latest.generation + 1, datetime.now(timezone.utc), duration)
+            self.error = None
+            return value
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as ex:
+                self.error = ex
+
+    def status(self):
+        latest = self.latest
+        if latest.finished_at is None:
+            return "Not refreshed yet"
+        text = f"Last refresh: {latest.finished_at:%Y-%m-%d %H:%M:%S} UTC (took {latest.duration:.1f}s)"
+        if self.error is not None:
+            text += f", the last attempt failed: {self.error}"
+        return text
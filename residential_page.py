@@ -1,40 +1,32 @@
+import os
+
 import gradio as gr
-from specklepy.api.client import SpeckleClient
-from specklepy.api.credentials import get_account_from_token
 import pandas as pd
 import plotly.express as px
-from config import speckle_token
+from speckle_connection import get_client, get_project
+from version_fetcher import BulkVersionFetcher
+from background_loader import BackgroundLoader
+from refresh_scheduler import RefreshScheduler
+from sheet_cache import SheetCache
 
-# Initialize Speckle client and credentials
-speckle_server = "macad.speckle.xyz"
-client = SpeckleClient(host=speckle_server)
-account = get_account_from_token(speckle_token, speckle_server)
-client.authenticate_with_account(account)
+# The Speckle client and project metadata are shared with the other pages (speckle_connection),
+# authentication and every network request happen in the background loader below
 
 # Project ID
 project_id = "28a211b286"
-project = client.project.get_with_models(project_id=project_id, models_limit=100)
-
-# Filter models whose names start with 'structure/'
-# models = [item for item in project.models.items]
-models = [item for item in project.models.items if item.name.startswith('residential/shared/')]
-model_unit = [item for item in project.models.items if item.name.startswith('residential/shared/unit_exterior_walls')][0]
-model_views = [item for item in project.models.items if item.name.startswith('residential/shared/units_best_views')][0]
-model_solar = [item for item in project.models.items if item.name.startswith('residential/shared/units_sun_hours')][0]
-models_name = [m.name for m in models]  # Extract model names
-model_name = models_name[0]  # Select the first model
-
-versions = client.version.get_versions(model_id=model_unit.id, project_id=project.id, limit=100).items
-version_unit = versions[0]  # Select the first version
-version_views = client.version.get_versions(model_id=model_views.id, project_id=project_id, limit=100).items[0]
-version_solar = client.version.get_versions(model_id=model_solar.id, project_id=project.id, limit=100).items[0]
+# Seconds between two refreshes of the latest versions of the residential models
+REFRESH_INTERVAL = 600
+# Project and residential models, set by load_residential_data
+project = None
+models = []
+version_fetcher = None
 
 def version_name(model, version):
     timestamp = model.createdAt.strftime("%Y-%m-%d %H:%M:%S")
-    return ' - '.join([version.authorUser.name, timestamp, version.message])
+    return ' - '.join([version["authorName"] or "", timestamp, version["message"]])
 
 def create_viewer_url(model, version):
-    embed_src = f"https://macad.speckle.xyz/projects/{project_id}/models/{model.id}@{version.id}#embed=%7B%22isEnabled%22%3Atrue%2C%7D"
+    embed_src = f"https://macad.speckle.xyz/projects/{project_id}/models/{model.id}@{version['versionId']}#embed=%7B%22isEnabled%22%3Atrue%2C%7D"
     iframe = f'<iframe src="{embed_src}" style="width:100%; height:750px; border:none;"></iframe>'
     return iframe
 
@@ -125,35 +117,86 @@ def plot_pie_chart(types_list, values_list):
 
 # Load Google Sheet
 sheet_csv_url = "https://docs.google.com/spreadsheets/d/1Ju7wDVKEIBMoE5DzkIIKqYtXg5rmnVC-52HSGhMYdew/export?format=csv&gid=2078375139"
+# Sheet source (the URL above or a local CSV file path, also settable with RESIDENTIAL_SHEET_SOURCE)
+# and seconds before asking it for changes again
+sheet_source = os.environ.get("RESIDENTIAL_SHEET_SOURCE", sheet_csv_url)
+sheet_ttl = 60
+sheet = SheetCache(sheet_source, ttl=sheet_ttl)
+
+# Table and pie charts of the last sheet version they were built from
+sheet_outputs = None
+sheet_outputs_version = None
 
 # Function to fetch and update DataFrame
 def update_dataframe():
-    df = pd.read_csv(sheet_csv_url)
+    df, _ = sheet.get()
     return df
 
-df = update_dataframe()
-
-def highlight_last_row(s):
+def highlight_last_row(s, last_index):
     color = 'rgba(73, 191, 102, 0.1)'  # Light blue with 50% transparency
-    return [f'background-color: {color}' if s.name == df.index[-1] else '' for _ in s]
+    return [f'background-color: {color}' if s.name == last_index else '' for _ in s]
 
-df = df.style.apply(highlight_last_row, axis=1) # Apply the highlighting
-
-# Function to update pie charts
+# Function to update pie charts, only rebuilt when the sheet content changed
 def update_pie_charts():
-    df = update_dataframe()
-    styler = df.style.apply(highlight_last_row, axis=1) # Apply the highlighting
+    global sheet_outputs, sheet_outputs_version
+    df, version = sheet.get()
+    if version == sheet_outputs_version:
+        return sheet_outputs
+    styler = df.style.apply(highlight_last_row, axis=1, last_index=df.index[-1]) # Apply the highlighting
     pie1 = plot_pie_chart(df['Unit type'].tolist()[:-2], df['Updated quantity (u)'].tolist()[:-2])
     pie2 = plot_pie_chart(df['Unit type'].tolist()[:-2], df['Updated Area (m2)'].tolist()[:-2])
     pie3 = plot_pie_chart(df['Unit type'].tolist()[:-2], df['Updated Population'].tolist()[:-2])
-    return styler, pie1, pie2, pie3
-
-df = update_pie_charts()[0]
-pie1 = update_pie_charts()[1]
-pie2 = update_pie_charts()[2]
-pie3 = update_pie_charts()[3]
+    sheet_outputs = (styler, pie1, pie2, pie3)
+    sheet_outputs_version = version
+    return sheet_outputs
 # pie2.show()
 
+
+def build_latest_versions():
+    # Record of the latest version of every residential model (None for models without versions), one
+    # request for all of them. The model dropdown reads from it, it never calls Speckle itself.
+    return dict(zip([m.id for m in models], version_fetcher.latest_versions(project.id, models)))
+
+latest_versions = RefreshScheduler(build_latest_versions, REFRESH_INTERVAL, name="residential-refresher")
+
+
+def load_residential_data(publish):
+    # Runs in the background so importing this page doesn't wait for the network:
+    # the sheet data and the Speckle models are published as soon as each is ready
+    global project, models, version_fetcher
+    styler, pie1, pie2, pie3 = update_pie_charts()
+    publish("data", styler)
+    publish("pie1", pie1)
+    publish("pie2", pie2)
+    publish("pie3", pie3)
+
+    client = get_client()
+    project = get_project(project_id)
+
+    # Filter models whose names start with 'structure/'
+    # models = [item for item in project.models.items]
+    models = [item for item in project.models.items if item.name.startswith('residential/shared/')]
+    model_unit = [item for item in project.models.items if item.name.startswith('residential/shared/unit_exterior_walls')][0]
+    model_views = [item for item in project.models.items if item.name.startswith('residential/shared/units_best_views')][0]
+    model_solar = [item for item in project.models.items if item.name.startswith('residential/shared/units_sun_hours')][0]
+    models_name = [m.name for m in models]  # Extract model names
+    publish("model_dropdown", gr.Dropdown(choices=models_name, label="Select Residential Team Model"))
+
+    version_fetcher = BulkVersionFetcher(client)
+    try:
+        versions = latest_versions.refresh()
+    finally:
+        latest_versions.start()
+    version_unit = versions[model_unit.id]  # Select the latest version
+    version_views = versions[model_views.id]
+    version_solar = versions[model_solar.id]
+    publish("version_text", version_name(model_unit, version_unit))
+    publish("viewer", create_viewer_url(model_unit, version_unit))
+    publish("viewer_views", create_viewer_url(model_views, version_views))
+    publish("viewer_solar", create_viewer_url(model_solar, version_solar))
+
+residential_loader = BackgroundLoader(load_residential_data, name="residential-loader").start()
+
 # More comprehensive CSS to remove all scrollbars
 custom_css = """
 /* Hide scrollbars for Chrome, Safari and Opera */
@@ -209,8 +252,8 @@ function refresh() {
 with gr.Blocks(css=custom_css, js=js_func, theme=gr.themes.Default(primary_hue="indigo", text_size="lg"), fill_width=True) as r_demo:
 
     with gr.Row(equal_height=True):
-            model_dropdown = gr.Dropdown(choices=models_name, label="Select Residential Team Model")
-            version_text = gr.Textbox(value = version_name(model_unit, version_unit), label="Last Version of selected model")
+            model_dropdown = gr.Dropdown(choices=[], label="Select Residential Team Model")
+            version_text = gr.Textbox(value = "Loading...", label="Last Version of selected model")
     with gr.Row(equal_height=True):
             viewer_iframe = gr.HTML()
             gr.Gallery(value=["residential_01.png", "residential_02.png", "residential_03.jpg"], label="Residential Team Images", 
@@ -219,7 +262,7 @@ with gr.Blocks(css=custom_css, js=js_func, theme=gr.themes.Default(primary_hue="
 
     gr.Markdown("#", height=50)
     gr.Markdown("# Data", container=True)            
-    data = gr.DataFrame(value=df, max_height=10000, label="Residential Team Metrics", interactive=False, show_fullscreen_button = True)
+    data = gr.DataFrame(max_height=10000, label="Residential Team Metrics", interactive=False, show_fullscreen_button = True)
 
     # Button to update the DataFrame manually
     update_button = gr.Button("Update Data & Pie Charts")
@@ -231,13 +274,13 @@ with gr.Blocks(css=custom_css, js=js_func, theme=gr.themes.Default(primary_hue="
     with gr.Row():
         with gr.Column():
             gr.Markdown("## Unit Type Distribution")
-            pie1 = gr.Plot(pie1, label="Unit Type Distribution", container=False)
+            pie1 = gr.Plot(label="Unit Type Distribution", container=False)
         with gr.Column():
             gr.Markdown("## Area Distribution")
-            pie2 = gr.Plot(pie2, label="Area Distribution", container=False)
+            pie2 = gr.Plot(label="Area Distribution", container=False)
         with gr.Column():
             gr.Markdown("## Population Distribution")
-            pie3 = gr.Plot(pie3, label="Population Distribution", container=False)
+            pie3 = gr.Plot(label="Population Distribution", container=False)
 
     with gr.Row():
         gr.Markdown("#", height=50)
@@ -277,16 +320,25 @@ with gr.Blocks(css=custom_css, js=js_func, theme=gr.themes.Default(primary_hue="
             bar_plot2 = gr.Plot(container=False)
 
 
-    # Load spekcle viewer
+    # Load spekcle viewers, data and pie charts as the background loader publishes them
+    residential_outputs = {
+        "data": data,
+        "pie1": pie1,
+        "pie2": pie2,
+        "pie3": pie3,
+        "model_dropdown": model_dropdown,
+        "version_text": version_text,
+        "viewer": viewer_iframe,
+        "viewer_views": viewer_iframe_views,
+        "viewer_solar": viewer_iframe_solar,
+    }
+
     def initialize_app():
-        viewer_url = create_viewer_url(model_unit, version_unit)
-        viewer_url_views = create_viewer_url(model_views, version_views)
-        viewer_url_solar = create_viewer_url(model_solar, version_solar)
-        return viewer_url, viewer_url_views, viewer_url_solar
+        yield from residential_loader.stream(list(residential_outputs))
 
 
 
-    r_demo.load(fn=initialize_app, outputs=[viewer_iframe, viewer_iframe_views, viewer_iframe_solar])
+    r_demo.load(fn=initialize_app, outputs=list(residential_outputs.values()))
     
 
     #Button actions
@@ -297,9 +349,11 @@ with gr.Blocks(css=custom_css, js=js_func, theme=gr.themes.Default(primary_hue="
     def handle_model_change(selected_model_name):
         selected_model = next((m for m in models if m.name == selected_model_name), None)
         if not selected_model:
-            return '<p>Model not found</p>'
-        version = client.version.get_versions(model_id=selected_model.id, project_id=project.id, limit=5).items[0]
-        return create_viewer_url(selected_model, version), version_name(selected_model, versions[0])
+            return '<p>Model not found</p>', ""
+        version = (latest_versions.value or {}).get(selected_model.id)
+        if version is None:
+            return '<p>No versions found for this model</p>', ""
+        return create_viewer_url(selected_model, version), version_name(selected_model, version)
 
 
     # Event handlers
@@ -0,0 +1,69 @@
+import hashlib
+import io
+import os
+import threading
+import time
+
+import pandas as pd
+import requests
+
+# Seconds during which the last fetched sheet is reused without asking the source again
+SHEET_TTL = 60
+
+
+class SheetCache:
+    # Keeps the last version of a CSV sheet. After the TTL the source is asked again:
+    # URLs with a conditional request (ETag / If-Modified-Since), local files by their
+    # modification time. The content hash tells whether the sheet really changed, and
+    # `version` only increases when it did, so callers can rebuild derived outputs
+    # (tables, charts) only for new content.
+    def __init__(self, source, ttl=SHEET_TTL, timeout=30):
+        self.source = source
+        self.ttl = ttl
+        self.timeout = timeout
+        self.df = None
+        self.version = 0
+        self.content_hash = None
+        self.checked_at = None
+        self._etag = None
+        self._last_modified = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        # Returns (DataFrame, version)
+        with self._lock:
+            if self.checked_at is None or time.monotonic() - self.checked_at >= self.ttl:
+                content = self._fetch()
+                self.checked_at = time.monotonic()
+                if content is not None:
+                    content_hash = hashlib.sha256(content).hexdigest()
+                    if content_hash != self.content_hash:
+                        self.df = pd.read_csv(io.BytesIO(content))
+                        self.content_hash = content_hash
+                        self.version += 1
+            return self.df, self.version
+
+    def _fetch(self):
+        # Content of the source, or None when it is known to be unchanged
+        if os.path.exists(self.source):
+            mtime = os.path.getmtime(self.source)
+            if mtime == self._mtime:
+                return None
+            self._mtime = mtime
+            with open(self.source, "rb") as f:
+                return f.read()
+
+        headers = {}
+        if self.df is not None:
+            if self._etag:
+                headers["If-None-Match"] = self._etag
+            if self._last_modified:
+                headers["If-Modified-Since"] = self._last_modified
+        response = requests.get(self.source, headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        self._etag = response.headers.get("ETag")
+        self._last_modified = response.headers.get("Last-Modified")
+        return response.content
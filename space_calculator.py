@@ -266,6 +266,7 @@ with gr.Blocks(theme=gr.themes.Default(primary_hue="indigo", text_size="lg"), cs
     btn.click(fn=update_outputs, inputs=[input_1, input_2, input_3, input_4, input_5, input_6, input_7, input_8, input_9, input_10, total_area_input], outputs=[output_df, population_output, output_dfTotals, output_pie_chart, output_pie_chartTotals,
                                                                                                                                                                     output_pie_chart_res, output_pie_chart_ind, output_pie_chart_ser])
 
-# Launch the app
-demo.launch()
+# Launch the app (not when imported, e.g. by benchmark.py)
+if __name__ == "__main__":
+    demo.launch()
 
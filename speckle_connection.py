@@ -0,0 +1,194 @@
+import os
+import threading
+import time
+
+import requests
+from gql import Client
+from gql.transport.exceptions import TransportServerError
+from gql.transport.requests import RequestsHTTPTransport
+from graphql import OperationDefinitionNode, OperationType
+from requests.adapters import HTTPAdapter
+from specklepy.api.client import SpeckleClient
+from specklepy.api.credentials import get_account_from_token, get_default_account
+from specklepy.logging import metrics
+from specklepy.transports.server import ServerTransport
+from urllib3.util.retry import Retry
+
+from diagnostics import InstrumentedSession, instrument_session
+
+try:
+    from config import speckle_token
+except ImportError:
+    # Scripts run without a config.py use the account of the local Speckle Manager
+    speckle_token = None
+
+# Shared by every page and script of the process. The environment can point them at
+# another server, e.g. the local stand-in of load_test.py (SPECKLE_SERVER=127.0.0.1:8090 SPECKLE_USE_SSL=0)
+SPECKLE_SERVER = os.environ.get("SPECKLE_SERVER", "macad.speckle.xyz")
+SPECKLE_USE_SSL = os.environ.get("SPECKLE_USE_SSL", "1") != "0"
+speckle_token = os.environ.get("SPECKLE_TOKEN", speckle_token)
+# Connections kept open to the server, shared by every client and transport
+POOL_SIZE = 16
+# Seconds a GraphQL request may take before it fails, so a hung server never blocks a page or a refresh
+REQUEST_TIMEOUT = 30
+# Seconds the project and model metadata is reused before being fetched again
+PROJECT_TTL = 300
+# Statuses of a server or proxy momentarily unavailable, worth another try
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Extra attempts of a failed GraphQL query, and seconds before the first one (doubled each time)
+QUERY_RETRIES = 3
+QUERY_BACKOFF = 0.1
+
+# One connection pool for the whole process: GraphQL requests and object downloads
+# reuse the same keep-alive connections instead of a new TLS handshake each time.
+# Every request is recorded in diagnostics (latency and bytes per GraphQL operation or object endpoint).
+# Only idempotent methods are retried here, GraphQL POSTs are retried by PooledHTTPTransport.
+_adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=POOL_SIZE,
+    max_retries=Retry(total=3, backoff_factor=0.1, status_forcelist=RETRY_STATUSES),
+)
+_session = InstrumentedSession()
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
+
+_lock = threading.Lock()
+_account = None
+_client = None
+_projects = {}
+
+
+class PooledHTTPTransport(RequestsHTTPTransport):
+    # gql opens a new requests session for every query and closes it afterwards, which
+    # drops the connection. This transport uses the shared pooled session and keeps it open.
+    def connect(self):
+        self.session = _session
+
+    def close(self):
+        pass
+
+    def execute(self, document, *args, **kwargs):
+        # Queries are tried again on transient failures. Mutations are not: the server may have
+        # applied one before failing (a 502 after version.create), a retry would apply it twice.
+        retries = 0 if _is_mutation(document) else QUERY_RETRIES
+        for attempt in range(retries + 1):
+            try:
+                return super().execute(document, *args, **kwargs)
+            except TransportServerError as ex:
+                if attempt == retries or ex.code not in RETRY_STATUSES:
+                    raise
+            except requests.ConnectionError:
+                if attempt == retries:
+                    raise
+            time.sleep(QUERY_BACKOFF * 2 ** attempt)
+
+
+class PooledSpeckleClient(SpeckleClient):
+    # A SpeckleClient whose resources are only set up once it has an account: the constructor
+    # would otherwise ask for the server version through gql's own unpooled transport first
+    def _init_resources(self):
+        if self.account.token:
+            super()._init_resources()
+
+
+def _is_mutation(document):
+    return any(
+        isinstance(definition, OperationDefinitionNode) and definition.operation == OperationType.MUTATION
+        for definition in document.definitions
+    )
+
+
+def get_account():
+    # Resolved once per process: the token from config.py, or the local default account
+    global _account
+    with _lock:
+        if _account is None:
+            if speckle_token:
+                _account = get_account_from_token(speckle_token, SPECKLE_SERVER)
+            else:
+                _account = get_default_account()
+        return _account
+
+
+def new_client(account=None):
+    # A client of the account sending its requests through the shared connection pool.
+    # specklepy serializes the requests of a client, threads working in parallel each need their own.
+    # The account is not checked with the server again (authenticate_with_account asks for the server
+    # info and the active user): setting a client up only costs the server version request.
+    account = account or get_account()
+    client = PooledSpeckleClient(host=SPECKLE_SERVER, use_ssl=SPECKLE_USE_SSL)
+    client.account = account
+    headers = {
+        "Authorization": f"Bearer {account.token}",
+        "Content-Type": "application/json",
+        "apollographql-client-name": metrics.HOST_APP,
+        "apollographql-client-version": metrics.HOST_APP_VERSION,
+    }
+    client.httpclient = Client(transport=PooledHTTPTransport(url=client.graphql, headers=headers, verify=client.verify_certificate, timeout=REQUEST_TIMEOUT))
+    client._init_resources()
+    return client
+
+
+def get_client():
+    # The client shared by every page and script
+    global _client
+    if _client is None:
+        account = get_account()
+        with _lock:
+            if _client is None:
+                _client = new_client(account)
+    return _client
+
+
+def server_transport(project_id, client=None):
+    # A ServerTransport whose object downloads go through the shared connection pool.
+    # Uploads are not pooled: specklepy's BatchSender opens its own session (with its own
+    # retry policy) in each of its sending threads. Those sessions are instrumented when
+    # they send their first batch, so uploads show in diagnostics too.
+    transport = ServerTransport(project_id, client or get_client())
+    session = InstrumentedSession()
+    session.headers.update(transport.session.headers)
+    session.mount("https://", _adapter)
+    session.mount("http://", _adapter)
+    transport.session = session
+    sender = getattr(transport, "_batch_sender", None)
+    if sender is not None:
+        send_batch = sender._bg_send_batch
+        sender._bg_send_batch = lambda session, batch: send_batch(instrument_session(session), batch)
+    return transport
+
+
+def get_project(project_id, max_age=PROJECT_TTL, models_limit=100):
+    # Project with its models, fetched once and shared until it is older than `max_age` seconds.
+    # Concurrent callers wait for the same request instead of sending their own.
+    with _lock:
+        entry = _projects.get(project_id)
+        if entry is None:
+            entry = _projects[project_id] = {"lock": threading.Lock(), "project": None, "fetched_at": 0}
+    with entry["lock"]:
+        if entry["project"] is None or time.monotonic() - entry["fetched_at"] > max_age:
+            entry["project"] = get_client().project.get_with_models(project_id=project_id, models_limit=models_limit)
+            entry["fetched_at"] = time.monotonic()
+        return entry["project"]
+
+
+def iter_models(project_id, page_size=100):
+    # Every model of the project, walking the server cursor page by page
+    cursor = None
+    while True:
+        page = get_client().model.get_models(project_id, models_limit=page_size, models_cursor=cursor)
+        yield from page.items
+        cursor = page.cursor
+        if not cursor or len(page.items) < page_size:
+            return
+
+
+def get_model(project_id, model_id=None, name=None):
+    # A model of the project by id or by name, from the cached project metadata.
+    # Models beyond the cached page are asked to the server directly.
+    for model in get_project(project_id).models.items:
+        if model.id == model_id or (name is not None and model.name == name):
+            return model
+    if model_id is not None:
+        return get_client().model.get(model_id, project_id)
+    return None
@@ -1,9 +1,14 @@
 import gradio as gr
 import pandas as pd
 import plotly.express as px
-from specklepy.api.client import SpeckleClient
-from specklepy.api.credentials import get_account_from_token
-from config import speckle_token
+from speckle_connection import get_client, get_project
+from project_snapshot import ProjectSnapshot
+from version_fetcher import BulkVersionFetcher
+from version_store import VersionStore
+from background_loader import BackgroundLoader
+from refresh_scheduler import RefreshScheduler
+from diagnostics import start_metrics_server, timed
+from diagnostics_page import instrument_handlers, render_diagnostics
 
 from residential_page import r_demo
 # from gradio_page import b_demo
@@ -61,19 +66,29 @@ function refresh() {
 
 
 
-# Initialize Speckle client and credentials
-speckle_server = "macad.speckle.xyz"
-client = SpeckleClient(host=speckle_server)
-account = get_account_from_token(speckle_token, speckle_server)
-client.authenticate_with_account(account)
-
+# The Speckle client and project metadata are shared with the other pages (speckle_connection),
+# authentication and every server request happen in the background loader below
 # Project ID
 project_id = "28a211b286"
-project = client.project.get_with_models(project_id=project_id, models_limit=100)
+# Seconds between two rebuilds of the dashboard data, and between two checks of an open page for a newer one
+REFRESH_INTERVAL = 600
+PAGE_CHECK_INTERVAL = 30
+
+version_fetcher = None
+version_store = VersionStore("speckle_versions.db")
+
+def current_dashboard():
+    # The dashboard being served: project, version snapshot and every chart and table computed from it.
+    # Replaced as a whole by each refresh, None until the first load is complete.
+    # Page handlers only read from it, they never call Speckle themselves.
+    return dashboard_refresher.value
 
 # Add this function to filter models by team selection
 def update_model_selection_by_team(team_selection):
-    models = project.models.items
+    dashboard = current_dashboard()
+    if dashboard is None:
+        return gr.Dropdown(choices=[], label="Select Model (loading...)", value=None)
+    models = dashboard["project"].models.items
 
     if team_selection == "Residential":
         filtered_models = [m.name for m in models if m.name.startswith('residential')]
@@ -91,13 +106,6 @@ def update_model_selection_by_team(team_selection):
     return gr.Dropdown(choices=filtered_models, label="Select Model", value=filtered_models[0] if filtered_models else None)
 
 
-def get_all_versions_in_project():
-    all_versions = []
-    for model in project.models.items:
-        versions = client.version.get_versions(model_id=model.id, project_id=project.id, limit=100).items
-        all_versions.extend(versions)
-    return all_versions
-
 # def update_model_selection(model_name):
 #     models = project.models.search(name=model_name)[0]
 #     return models
@@ -113,56 +121,39 @@ def get_all_versions_in_project():
 
 
 # Function to update viewer and stats
-def create_viewer_url(model_name):
+def create_viewer_url(model_name, dashboard=None):
+    if dashboard is None:
+        dashboard = current_dashboard()
+    if dashboard is None:
+        return "Loading project..."
     # Find the model in the project
-    model = next((m for m in project.models.items if m.name == model_name), None)
+    model = next((m for m in dashboard["project"].models.items if m.name == model_name), None)
     if model:
-        versions = client.version.get_versions(model_id=model.id, project_id=project_id, limit=1).items
-        if versions:
-            version = versions[0]
-            embed_src = f"https://macad.speckle.xyz/projects/{project_id}/models/{model.id}@{version.id}#embed=%7B%22isEnabled%22%3Atrue%2C%7D"
+        version_id = dashboard["snapshot"].latest_version_id(model.id)
+        if version_id:
+            embed_src = f"https://macad.speckle.xyz/projects/{project_id}/models/{model.id}@{version_id}#embed=%7B%22isEnabled%22%3Atrue%2C%7D"
             return f'<iframe src="{embed_src}" style="width:100%; height:850px; border:none;"></iframe>'
         else:
             return "No versions found for this model."
     else:
         return "Model not found."
 
-def generate_model_statistics():
-    models = project.models.items
-    data = [{"Model Name": m.name, "Total Commits": len(client.version.get_versions(model_id=m.id, project_id=project.id, limit=100).items)} for m in models]
-    df = pd.DataFrame(data)
+def generate_model_statistics(snapshot):
+    counts = snapshot.commit_counts()
+    df = pd.DataFrame({"Model Name": counts.index, "Total Commits": counts.values})
     df = df.sort_values(by="Model Name")
     return df
 
 def generate_connector_statistics(all_versions):
-    connector_list = [v.sourceApplication for v in all_versions]
-    df = pd.DataFrame(connector_list, columns=["Connector"])
-    df = df["Connector"].value_counts().reset_index()
+    df = all_versions["sourceApplication"].value_counts().reset_index()
     df.columns = ["Connector", "Usage Count"]
     return df
 
 def generate_contributor_statistics(all_versions):
-    contributors = [v.authorUser.name for v in all_versions]
-    df = pd.DataFrame(contributors, columns=["Contributor"])
-    df = df["Contributor"].value_counts().reset_index()
+    df = all_versions["authorName"].value_counts().reset_index()
     df.columns = ["Contributor", "Contributions"]
     return df
 
-
-# def generate_statistics():
-all_versions = get_all_versions_in_project()
-model_stats_df = generate_model_statistics()
-connector_stats_df = generate_connector_statistics(all_versions)
-contributor_stats_df = generate_contributor_statistics(all_versions)
-    
-#     return model_stats_df, connector_stats_df, contributor_stats_df
-
-# def create_graphs():
-models = project.models.items
-# Extract models and their commit counts
-model_counts = pd.DataFrame([
-    [m.name, len(client.version.get_versions(model_id=m.id, project_id=project.id, limit=100).items)] for m in models], columns=["modelName", "totalCommits"])
-
 # Define function to categorize models
 def categorize_model(name):
     if name.startswith("residential"):
@@ -180,116 +171,182 @@ def categorize_model(name):
     else:
         return "Other"
 
-# Apply categorization
-model_counts["team"] = model_counts["modelName"].apply(categorize_model)
-model_counts["modelName"] = model_counts["modelName"].apply(lambda x: x.split('/', 1)[1] if '/' in x else x)
-
-# Create bar plot grouped by category
-model_graph = px.bar(
-    model_counts, 
-    x="modelName", 
-    y="totalCommits", 
-    color="team",  # Grouped by category
-    color_discrete_map={
-        "Residential": "#338547",
-        "Facade": "#652cb3",
-        "Structure": "#1864b5",
-        "Service": "#ff8800",
-        "Industrial": "#b50709",
-        "Data": "white",         
-        "Other": "gray"
-    }
-)
-
-# Update layout for dark mode
-model_graph.update_layout(
-    height=800,
-    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="left", x=0),
-    paper_bgcolor='rgb(15, 15, 15)',
-    plot_bgcolor='rgb(15, 15, 15)',
-    font=dict(color='white'),
-    title_font=dict(color='white')
-)
-
-# Connector distribution
-version_frame = pd.DataFrame.from_dict([{"sourceApplication": v.sourceApplication} for v in all_versions])
-apps = version_frame["sourceApplication"].value_counts().reset_index()
-apps.columns = ["app", "count"]
-connector_graph = px.pie(apps, names="app", values="count", hole=0.3, color_discrete_sequence=px.colors.sequential.Emrld)
-connector_graph.update_layout(
-    height = 600,
-    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="left", x=0),
-    paper_bgcolor='rgb(15, 15, 15)',  # Background color of the entire chart
-    plot_bgcolor='rgb(15, 15, 15)',    # Background color of the plot area
-    font=dict(color='white'),          # Font color for better contrast
-    title_font=dict(color='white'))
-connector_graph.update_traces(textposition='outside', sort = False, pull=[0.1] * len(apps))  # Display values outside bars
-
-# Contributor distribution
-version_user_names = [v.authorUser.name for v in all_versions]
-authors = pd.DataFrame(version_user_names).value_counts().reset_index()
-authors.columns = ["author", "count"]
-contributor_graph = px.pie(authors, names="author", values="count", hole=0.3, color_discrete_sequence=px.colors.sequential.Sunsetdark)
-contributor_graph.update_layout(
-    height = 600,
-    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="left", x=0),
-    paper_bgcolor='rgb(15, 15, 15)',  # Background color of the entire chart
-    plot_bgcolor='rgb(15, 15, 15)',    # Background color of the plot area
-    font=dict(color='white'),          # Font color for better contrast
-    title_font=dict(color='white'))
-    
-#     return model_graph, connector_graph, contributor_graph
-
-# model_graph, connector_graph, contributor_graph = create_graphs()
-
-# Aggregate commits per team
-team_commit_counts = model_counts.groupby("team")["totalCommits"].sum().reset_index()
-custom_order = ['Data', 'Residential', 'Service', 'Structure', 'Industrial', 'Facade', 'Others']
-
-# Convert 'team' to a categorical type with the custom order
-team_commit_counts['team'] = pd.Categorical(
-    team_commit_counts['team'], 
-    categories=custom_order, 
-    ordered=True
-)
-
-# Sort the DataFrame by the 'team' column
-team_commit_counts = team_commit_counts.sort_values('team')
-
-team_graph = px.bar(
-    team_commit_counts, 
-    x="team", 
-    y="totalCommits", 
-    color="team", 
-    title="Total Commits per Team",
-    color_discrete_map={
-        "Residential": "#338547",
-        "Facade": "#652cb3",
-        "Structure": "#1864b5",
-        "Service": "#ff8800",
-        "Industrial": "#b50709",
-        "Data": "white",         
-        "Other": "gray"
-    }
-)
-
-# Update layout for dark mode
-team_graph.update_layout(
-    height=600,
-    paper_bgcolor='rgb(15, 15, 15)',
-    plot_bgcolor='rgb(15, 15, 15)',
-    font=dict(color='white'),
-    title_font=dict(color='white')
-)
-
-def create_timeline():
-    all_versions = get_all_versions_in_project()
-    timestamps = [version.createdAt.date() for version in all_versions]
-    timestamps_frame = pd.DataFrame(timestamps, columns=["createdAt"]).value_counts().reset_index()
+def create_model_counts(snapshot):
+    # Extract models and their commit counts
+    commit_counts = snapshot.commit_counts()
+    model_counts = pd.DataFrame({"modelName": commit_counts.index, "totalCommits": commit_counts.values})
+
+    # Apply categorization
+    model_counts["team"] = model_counts["modelName"].apply(categorize_model)
+    model_counts["modelName"] = model_counts["modelName"].apply(lambda x: x.split('/', 1)[1] if '/' in x else x)
+    return model_counts
+
+def create_model_graph(model_counts):
+    # Create bar plot grouped by category
+    model_graph = px.bar(
+        model_counts, 
+        x="modelName", 
+        y="totalCommits", 
+        color="team",  # Grouped by category
+        color_discrete_map={
+            "Residential": "#338547",
+            "Facade": "#652cb3",
+            "Structure": "#1864b5",
+            "Service": "#ff8800",
+            "Industrial": "#b50709",
+            "Data": "white",         
+            "Other": "gray"
+        }
+    )
+
+    # Update layout for dark mode
+    model_graph.update_layout(
+        height=800,
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="left", x=0),
+        paper_bgcolor='rgb(15, 15, 15)',
+        plot_bgcolor='rgb(15, 15, 15)',
+        font=dict(color='white'),
+        title_font=dict(color='white')
+    )
+    return model_graph
+
+def create_connector_graph(all_versions):
+    # Connector distribution
+    apps = all_versions["sourceApplication"].value_counts().reset_index()
+    apps.columns = ["app", "count"]
+    connector_graph = px.pie(apps, names="app", values="count", hole=0.3, color_discrete_sequence=px.colors.sequential.Emrld)
+    connector_graph.update_layout(
+        height = 600,
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="left", x=0),
+        paper_bgcolor='rgb(15, 15, 15)',  # Background color of the entire chart
+        plot_bgcolor='rgb(15, 15, 15)',    # Background color of the plot area
+        font=dict(color='white'),          # Font color for better contrast
+        title_font=dict(color='white'))
+    connector_graph.update_traces(textposition='outside', sort = False, pull=[0.1] * len(apps))  # Display values outside bars
+    return connector_graph
+
+def create_contributor_graph(all_versions):
+    # Contributor distribution
+    authors = all_versions["authorName"].value_counts().reset_index()
+    authors.columns = ["author", "count"]
+    contributor_graph = px.pie(authors, names="author", values="count", hole=0.3, color_discrete_sequence=px.colors.sequential.Sunsetdark)
+    contributor_graph.update_layout(
+        height = 600,
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="left", x=0),
+        paper_bgcolor='rgb(15, 15, 15)',  # Background color of the entire chart
+        plot_bgcolor='rgb(15, 15, 15)',    # Background color of the plot area
+        font=dict(color='white'),          # Font color for better contrast
+        title_font=dict(color='white'))
+    return contributor_graph
+
+def create_team_graph(model_counts):
+    # Aggregate commits per team
+    team_commit_counts = model_counts.groupby("team")["totalCommits"].sum().reset_index()
+    custom_order = ['Data', 'Residential', 'Service', 'Structure', 'Industrial', 'Facade', 'Others']
+
+    # Convert 'team' to a categorical type with the custom order
+    team_commit_counts['team'] = pd.Categorical(
+        team_commit_counts['team'], 
+        categories=custom_order, 
+        ordered=True
+    )
+
+    # Sort the DataFrame by the 'team' column
+    team_commit_counts = team_commit_counts.sort_values('team')
+
+    team_graph = px.bar(
+        team_commit_counts, 
+        x="team", 
+        y="totalCommits", 
+        color="team", 
+        title="Total Commits per Team",
+        color_discrete_map={
+            "Residential": "#338547",
+            "Facade": "#652cb3",
+            "Structure": "#1864b5",
+            "Service": "#ff8800",
+            "Industrial": "#b50709",
+            "Data": "white",         
+            "Other": "gray"
+        }
+    )
+
+    # Update layout for dark mode
+    team_graph.update_layout(
+        height=600,
+        paper_bgcolor='rgb(15, 15, 15)',
+        plot_bgcolor='rgb(15, 15, 15)',
+        font=dict(color='white'),
+        title_font=dict(color='white')
+    )
+    return team_graph
+
+def create_timeline(all_versions):
+    timestamps = pd.to_datetime(all_versions["createdAt"], utc=True).dt.date
+    timestamps_frame = timestamps.value_counts().reset_index()
     timestamps_frame.columns = ["date", "count"]
     timestamps_frame["date"] = pd.to_datetime(timestamps_frame["date"])
     # timeline = px.line(timestamps_frame.sort_values("date"), x="date", y="count", title="Commit Activity Timeline", markers=True)
     return timestamps_frame
+
+
+def build_dashboard(publish=None):
+    # Fetches the project, syncs its versions and computes every chart and table from them.
+    # Runs in the background, for the first load and for every scheduled refresh. With `publish`,
+    # each output is also handed to the page as soon as it is ready.
+    if publish is None:
+        publish = lambda name, value: None
+    project = get_project(project_id)
+    outputs = {}
+
+    def add_output(name, value):
+        outputs[name] = value
+        publish(name, value)
+
+    models_res = [item for item in project.models.items if item.name.startswith('residential/')]
+    models_name_res = [m.name for m in models_res]
+    models_name_res = [name.split('/', 1)[1] if '/' in name else name for name in models_name_res]
+    add_output("model_dropdown", gr.Dropdown(choices=models_name_res, label="Select Model"))
+
+    # Sync the local version store (only versions newer than the last run are downloaded, the versions
+    # of many models per request with only the fields used here) and read the whole history from it, all the statistics below are computed from it
+    with timed("compute", "dashboard snapshot"):
+        snapshot = ProjectSnapshot(get_client(), project, fetcher=version_fetcher, store=version_store)
+    all_versions = snapshot.versions
+    dashboard = {"project": project, "snapshot": snapshot, "outputs": outputs}
+    add_output("viewer", create_viewer_url('residential/shared/unit_exterior_walls', dashboard))
+
+    add_output("connector_plot", create_connector_graph(all_versions))
+    add_output("contributor_plot", create_contributor_graph(all_versions))
+    model_counts = create_model_counts(snapshot)
+    add_output("model_plot", create_model_graph(model_counts))
+    add_output("team_plot", create_team_graph(model_counts))
+    add_output("timeline_plot", create_timeline(all_versions))
+    add_output("model_stats", generate_model_statistics(snapshot))
+    add_output("connector_stats", generate_connector_statistics(all_versions))
+    add_output("contributor_stats", generate_contributor_statistics(all_versions))
+    return dashboard
+
+dashboard_refresher = RefreshScheduler(build_dashboard, REFRESH_INTERVAL, name="dashboard-refresher")
+
+
+def load_dashboard(publish):
+    # Runs in the background: connects and builds the first dashboard, publishing every chart
+    # and table as soon as it is ready while the page is already being served, then leaves
+    # the following rebuilds to the refresh scheduler
+    global version_fetcher
+    publish("status", "Connecting to Speckle...")
+    version_fetcher = BulkVersionFetcher(get_client())
+
+    publish("status", "Loading project activity...")
+    try:
+        dashboard_refresher.refresh(publish)
+        publish("generation", dashboard_refresher.generation)
+    finally:
+        dashboard_refresher.start()
+    publish("status", "")
+
+dashboard_loader = BackgroundLoader(load_dashboard, name="dashboard-loader").start()
     
 
 
@@ -299,17 +356,16 @@ with gr.Blocks(title="Speckle Stream Activity Dashboard", css=custom_css, js=js_
     with gr.Tab("Speckle Insights"):
         gr.Markdown("# Speckle Stream Activity Dashboard 📈")
         gr.Markdown("### HyperBuilding B Analytics")
+        loading_status = gr.Markdown("Loading project data...")
+        refresh_status = gr.Markdown(dashboard_refresher.status)
         gr.Markdown("# Team Models Analysis", container=True)
         with gr.Row():
             with gr.Column(scale=2):
                 viewer_iframe = gr.HTML()
 
             with gr.Column():
-                models_res = [item for item in project.models.items if item.name.startswith('residential/')]
-                models_name_res = [m.name for m in models_res]
-                models_name_res = [name.split('/', 1)[1] if '/' in name else name for name in models_name_res]
                 team_dropdown = gr.Dropdown(choices=["Residential", "Structure", "Service", "Facade", "Industrial", "Data"], label="Select Team",value="Residential")
-                model_dropdown = gr.Dropdown(choices=models_name_res, label="Select Model")
+                model_dropdown = gr.Dropdown(choices=[], label="Select Model")
                 # version_dropdown = gr.Dropdown(label="Select Version")
                 
         
@@ -321,38 +377,85 @@ with gr.Blocks(title="Speckle Stream Activity Dashboard", css=custom_css, js=js_
             gr.Markdown("# Application Usage", container=True)
             gr.Markdown("# Contributor Distribution", container=True)
         with gr.Row():
-            connector_plot = gr.Plot(connector_graph, container=False, label="Connector Distribution")
-            contributor_plot = gr.Plot(contributor_graph, container=False, label="Contributor Distribution")
+            connector_plot = gr.Plot(container=False, label="Connector Distribution")
+            contributor_plot = gr.Plot(container=False, label="Contributor Distribution")
 
         
         
-        model_plot = gr.Plot(model_graph, container=False, label="Model Commit Distribution")
-        team_plot = gr.Plot(team_graph, container=False, label="Team Commit Distribution")
+        model_plot = gr.Plot(container=False, label="Model Commit Distribution")
+        team_plot = gr.Plot(container=False, label="Team Commit Distribution")
             
         
         with gr.Row():
-            timestamps_frame = create_timeline()
-            timeline_plot = gr.LinePlot(timestamps_frame, x = "date", y = "count", height=400)
+            timeline_plot = gr.LinePlot(x = "date", y = "count", height=400)
         
         with gr.Row(equal_height=True):
             with gr.Column():
-                model_stats = gr.Dataframe(model_stats_df, label="Model Statistics", datatype=["str", "number"], show_fullscreen_button=True, show_copy_button=True, wrap=True, max_height=1000)
+                model_stats = gr.Dataframe(headers=["Model Name", "Total Commits"], label="Model Statistics", datatype=["str", "number"], show_fullscreen_button=True, show_copy_button=True, wrap=True, max_height=1000)
             with gr.Column():
-                connector_stats = gr.Dataframe(connector_stats_df, label="Connector Statistics", datatype=["str", "number"])
-                contributor_stats = gr.Dataframe(contributor_stats_df, label="Contributor Statistics", datatype=["str", "number"])
+                connector_stats = gr.Dataframe(headers=["Connector", "Usage Count"], label="Connector Statistics", datatype=["str", "number"])
+                contributor_stats = gr.Dataframe(headers=["Contributor", "Contributions"], label="Contributor Statistics", datatype=["str", "number"])
     
     with gr.Tab("Residential Team"):
         r_demo.render()
+
+    # Where the time goes: event handlers, Speckle requests and computation stages of this server
+    with gr.Tab("Diagnostics"):
+        render_diagnostics()
         
     # # with gr.Tab("Building Analysis"):
     # #     b_demo.render()
 
-    # Load spekcle viewer
-    def initialize_app():
-        viewer_url = create_viewer_url('residential/shared/unit_exterior_walls')
-        return viewer_url
+    # Fill in the spekcle viewer, charts and tables as the background loader publishes them
+    dashboard_outputs = {
+        "status": loading_status,
+        "viewer": viewer_iframe,
+        "model_dropdown": model_dropdown,
+        "connector_plot": connector_plot,
+        "contributor_plot": contributor_plot,
+        "model_plot": model_plot,
+        "team_plot": team_plot,
+        "timeline_plot": timeline_plot,
+        "model_stats": model_stats,
+        "connector_stats": connector_stats,
+        "contributor_stats": contributor_stats,
+    }
 
-    demo.load(fn=initialize_app, outputs=[viewer_iframe])
+    # Charts and tables replaced when a refresh swapped in a newer dashboard,
+    # and the dashboard generation the page shows
+    refreshed_outputs = {name: dashboard_outputs[name] for name in [
+        "connector_plot", "contributor_plot", "model_plot", "team_plot", "timeline_plot",
+        "model_stats", "connector_stats", "contributor_stats",
+    ]}
+    shown_generation = gr.State(0)
+    refresh_timer = gr.Timer(PAGE_CHECK_INTERVAL)
+
+    def initialize_app():
+        latest = dashboard_refresher.latest
+        if latest.value is not None:
+            # Once a dashboard is built the page gets the current one straight from memory
+            outputs = latest.value["outputs"]
+            yield [outputs.get(name, "") for name in dashboard_outputs] + [latest.generation]
+            return
+        for values in dashboard_loader.stream(list(dashboard_outputs)):
+            yield values + [gr.update()]
+        # The outputs above come from the first build (none when it failed), newer ones are sent by the timer
+        yield [gr.update()] * len(dashboard_outputs) + [dashboard_loader.get("generation", 0)]
+
+    def refresh_page(generation):
+        # Reads the current dashboard from memory, outputs are only sent again when it changed
+        latest = dashboard_refresher.latest
+        if latest.value is None or latest.generation == generation:
+            return [generation, dashboard_refresher.status()] + [gr.update()] * len(refreshed_outputs)
+        outputs = latest.value["outputs"]
+        return [latest.generation, dashboard_refresher.status()] + [outputs[name] for name in refreshed_outputs]
+
+    demo.load(fn=initialize_app, outputs=list(dashboard_outputs.values()) + [shown_generation])
+    refresh_timer.tick(
+        fn=refresh_page,
+        inputs=shown_generation,
+        outputs=[shown_generation, refresh_status] + list(refreshed_outputs.values())
+    )
 
 
     # Event handlers
@@ -377,7 +480,9 @@ with gr.Blocks(title="Speckle Stream Activity Dashboard", css=custom_css, js=js_
     # )
 
 
+instrument_handlers(demo)
 
+start_metrics_server()
 demo.launch()
 
 # gradio speckle_insights.py
\ No newline at end of file
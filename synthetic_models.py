@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import numpy as np
+from specklepy.objects import Base
+from specklepy.objects.geometry import Point
+
+# Categories of the synthetic buildings, with the material values the property script would assign
+SYNTHETIC_CATEGORIES = {
+    "@Floors": (2400, 0.159),
+    "@Walls": (2400, 0.159),
+    "@Columns": (7800, 1.37),
+    "@Stairs": (7800, 0.13),
+    "@Facade": (2500, 20.85),
+    "@Roof": (2400, 0.159),
+    "@Windows": (2500, 0.11),
+    "@Furniture": (600, 0.45),
+}
+SOURCE_APPLICATIONS = ["Rhino", "Grasshopper", "Revit", "Blender", "Python"]
+
+
+def synthetic_model(elements=1000, categories=6, vertices_per_mesh=24, seed=0, point_lists=False):
+    # A Base object shaped like the received building models: one dynamic member per category
+    # (`@Walls`, `@Floors`...) listing its elements, each with a volume (an area for windows),
+    # material values and a displayValue mesh of `vertices_per_mesh` vertices.
+    # With `point_lists`, the vertices are a `Vertices` list of Point objects instead of a mesh.
+    rng = np.random.default_rng(seed)
+    names = list(SYNTHETIC_CATEGORIES)[:categories]
+    counts = np.bincount(rng.integers(0, len(names), elements), minlength=len(names))
+    model = Base()
+    for name, count in zip(names, counts):
+        density, carbon = SYNTHETIC_CATEGORIES[name]
+        members = []
+        for _ in range(count):
+            element = Base()
+            if name == "@Windows":
+                element["area"] = float(rng.uniform(0.5, 4))
+            else:
+                element["volume"] = float(rng.uniform(0.1, 20))
+            element["@density"] = density
+            element["@embodied_carbon"] = carbon
+            origin = rng.uniform(0, 100, 3)
+            xyz = origin + rng.uniform(0, 5, (vertices_per_mesh, 3))
+            if point_lists:
+                element["Vertices"] = [Point(x=x, y=y, z=z, units="m") for x, y, z in xyz.tolist()]
+            else:
+                mesh = Base()
+                mesh["vertices"] = xyz.ravel().tolist()
+                element["displayValue"] = [mesh]
+            members.append(element)
+        model[name] = members
+    return model
+
+
+def synthetic_versions(models=20, versions=100, authors=8, seed=0):
+    # Models and their version histories as the version fetchers return them:
+    # (models, [[version record, newest first] per model]), spread over the last year
+    rng = np.random.default_rng(seed)
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    model_list = [SimpleNamespace(id=f"model{i:04d}", name=f"team{i % 3}/model {i}") for i in range(models)]
+    histories = []
+    for model in model_list:
+        ages = np.sort(rng.uniform(0, 365 * 24 * 3600, versions))
+        histories.append([
+            {
+                "versionId": f"{model.id}v{j:05d}",
+                "sourceApplication": SOURCE_APPLICATIONS[rng.integers(len(SOURCE_APPLICATIONS))],
+                "authorName": f"author {rng.integers(authors)}",
+                "createdAt": now - timedelta(seconds=float(age)),
+                "message": "synthetic version",
+                "referencedObject": f"{model.id}o{j:05d}",
+            }
+            for j, age in enumerate(ages)
+        ])
+    return model_list, histories
+
+
+class SyntheticVersionFetcher:
+    # Serves synthetic histories through the version fetcher interface of VersionStore.sync
+    def __init__(self, histories):
+        self.histories = histories
+
+    def fetch_since(self, project_id, models, since):
+        return [
+            [v for v in history if model.id not in since or v["createdAt"] >= since[model.id]]
+            for model, history in zip(models, self.histories)
+        ]
@@ -0,0 +1,191 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from datetime import datetime
+
+from gql import gql
+
+from speckle_connection import new_client
+
+# Maximum number of simultaneous requests to the Speckle server
+MAX_WORKERS = 8
+# Seconds to wait for the versions of a single model
+FETCH_TIMEOUT = 30
+# Versions requested per page when walking a model's history
+PAGE_SIZE = 25
+# Models per aliased request of the bulk fetcher, and versions per model in each of them.
+# Small enough to stay under the server's query complexity limits.
+MODELS_PER_QUERY = 20
+BULK_PAGE_SIZE = 100
+
+
+def iter_versions(client, project_id, model_id, page_size=PAGE_SIZE):
+    # Walks the server cursor page by page and yields versions newest first.
+    # Only one page is held in memory, and callers can stop whenever they want.
+    cursor = None
+    while True:
+        page = client.version.get_versions(model_id=model_id, project_id=project_id, limit=page_size, cursor=cursor)
+        yield from page.items
+        cursor = page.cursor
+        if not cursor or len(page.items) < page_size:
+            return
+
+
+def version_record(version):
+    # The fields of a version the dashboards use
+    return {
+        "versionId": version.id,
+        "sourceApplication": version.sourceApplication,
+        "authorName": version.authorUser.name if version.authorUser else None,
+        "createdAt": version.createdAt,
+        "message": version.message,
+        "referencedObject": version.referencedObject,
+    }
+
+
+def latest_version(client, project_id, model_id):
+    return next(iter_versions(client, project_id, model_id, page_size=1), None)
+
+
+class ConcurrentVersionFetcher:
+    # Runs version requests in parallel on a bounded thread pool, each worker thread with its own client.
+    # Results always come back in the same order as the items that were passed in.
+    def __init__(self, client, max_workers=MAX_WORKERS, timeout=FETCH_TIMEOUT):
+        self.client = client
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speckle-versions")
+        self._local = threading.local()
+
+    def _thread_client(self):
+        # specklepy serializes every request of a client behind a lock,
+        # so each worker thread talks to the server through its own client (all sharing one connection pool)
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = new_client(self.client.account)
+            self._local.client = client
+        return client
+
+    def _call(self, func, item):
+        return func(self._thread_client(), item)
+
+    def map(self, func, items):
+        # Runs func(client, item) for every item on the pool, results in item order
+        futures = [self._pool.submit(self._call, func, item) for item in items]
+        results = []
+        try:
+            for future in futures:
+                try:
+                    results.append(future.result(timeout=self.timeout))
+                except TimeoutError:
+                    raise TimeoutError(f"Fetching versions took longer than {self.timeout}s")
+        finally:
+            for future in futures:
+                future.cancel()
+        return results
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _bulk_versions_query(count):
+    # One aliased `model` field per model (m0, m1, ...), each with its own cursor,
+    # selecting only the version fields the dashboards use
+    variables = ", ".join(f"$m{i}: String!, $c{i}: String" for i in range(count))
+    models = "\n".join(
+        f"""m{i}: model(id: $m{i}) {{
+            versions(limit: $limit, cursor: $c{i}) {{
+                cursor
+                items {{ id sourceApplication createdAt message referencedObject authorUser {{ name }} }}
+            }}
+        }}"""
+        for i in range(count)
+    )
+    return gql(f"query BulkVersions($projectId: String!, $limit: Int!, {variables}) {{ project(id: $projectId) {{ {models} }} }}")
+
+
+def _bulk_record(item):
+    return {
+        "versionId": item["id"],
+        "sourceApplication": item["sourceApplication"],
+        "authorName": item["authorUser"]["name"] if item["authorUser"] else None,
+        "createdAt": datetime.fromisoformat(item["createdAt"].replace("Z", "+00:00")),
+        "message": item["message"],
+        "referencedObject": item["referencedObject"],
+    }
+
+
+class BulkVersionFetcher:
+    # Fetches the versions of many models with few requests: every request asks for a page of
+    # versions of up to `models_per_query` models at once (aliased fields of one GraphQL query)
+    # and selects only the fields in `version_record`. Models with more pages are asked again
+    # with their cursor in the next round. The requests of a round run in parallel on a
+    # ConcurrentVersionFetcher pool.
+    def __init__(self, client, models_per_query=MODELS_PER_QUERY, page_size=BULK_PAGE_SIZE, max_workers=MAX_WORKERS, timeout=FETCH_TIMEOUT):
+        self.client = client
+        self.models_per_query = models_per_query
+        self.page_size = page_size
+        self.pool = ConcurrentVersionFetcher(client, max_workers, timeout)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._queries = {}
+
+    def _query(self, count):
+        with self._lock:
+            if count not in self._queries:
+                self._queries[count] = _bulk_versions_query(count)
+            return self._queries[count]
+
+    def fetch_pages(self, project_id, model_ids, cursors, limit=None, client=None):
+        # One request: the next page of versions of every model, as (items, cursor) per model id
+        variables = {"projectId": project_id, "limit": limit or self.page_size}
+        for i, model_id in enumerate(model_ids):
+            variables[f"m{i}"] = model_id
+            variables[f"c{i}"] = cursors.get(model_id)
+        response = (client or self.client).httpclient.execute(self._query(len(model_ids)), variable_values=variables)
+        with self._lock:
+            self.requests += 1
+        project = response["project"]
+        return {
+            model_id: (project[f"m{i}"]["versions"]["items"], project[f"m{i}"]["versions"]["cursor"])
+            for i, model_id in enumerate(model_ids)
+        }
+
+    def _fetch_chunks(self, project_id, model_ids, cursors, limit=None):
+        # The next page of every model, one request per chunk of `models_per_query` models.
+        # A single request is sent from the calling thread, several in parallel on the pool.
+        # Either way every request is bounded by the client's REQUEST_TIMEOUT.
+        chunks = [model_ids[start:start + self.models_per_query] for start in range(0, len(model_ids), self.models_per_query)]
+        if len(chunks) == 1:
+            return self.fetch_pages(project_id, chunks[0], cursors, limit)
+        pages = {}
+        for chunk_pages in self.pool.map(lambda client, chunk: self.fetch_pages(project_id, chunk, cursors, limit, client), chunks):
+            pages.update(chunk_pages)
+        return pages
+
+    def latest_versions(self, project_id, models):
+        # Record of the latest version of every model (None for models without versions)
+        pages = self._fetch_chunks(project_id, [m.id for m in models], {}, limit=1)
+        return [_bulk_record(pages[m.id][0][0]) if pages[m.id][0] else None for m in models]
+
+    def fetch_since(self, project_id, models, since):
+        # Records of the versions created at or after since[model.id] (every version when missing),
+        # newest first, one list per model
+        records = {m.id: [] for m in models}
+        cursors = {}
+        pending = [m.id for m in models]
+        while pending:
+            next_pending = []
+            for model_id, (items, cursor) in self._fetch_chunks(project_id, pending, cursors).items():
+                mark = since.get(model_id)
+                complete = not cursor or len(items) < self.page_size
+                for item in items:
+                    record = _bulk_record(item)
+                    if mark is not None and record["createdAt"] < mark:
+                        complete = True
+                        break
+                    records[model_id].append(record)
+                if not complete:
+                    cursors[model_id] = cursor
+                    next_pending.append(model_id)
+            pending = next_pending
+        return [records[m.id] for m in models]
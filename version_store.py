@@ -0,0 +1,104 @@
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+import pandas as pd
+
+# Local database holding every version seen so far
+VERSION_STORE_PATH = "speckle_versions.db"
+
+VERSION_FIELDS = ["modelId", "versionId", "sourceApplication", "authorName", "createdAt", "message", "referencedObject"]
+
+
+def to_timestamp(created_at):
+    # ISO strings in UTC sort the same way as the dates they represent
+    return created_at.astimezone(timezone.utc).isoformat()
+
+
+class VersionStore:
+    # Persistent SQLite copy of the project's version history.
+    # Each model keeps a high-water mark (newest createdAt stored), so a refresh
+    # only downloads versions created at or after it.
+    def __init__(self, path=VERSION_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS versions (
+                    modelId TEXT NOT NULL,
+                    versionId TEXT NOT NULL,
+                    sourceApplication TEXT,
+                    authorName TEXT,
+                    createdAt TEXT NOT NULL,
+                    message TEXT,
+                    referencedObject TEXT,
+                    PRIMARY KEY (modelId, versionId)
+                )"""
+            )
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS sync_state (
+                    modelId TEXT PRIMARY KEY,
+                    highWaterMark TEXT NOT NULL
+                )"""
+            )
+
+    def high_water_marks(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT modelId, highWaterMark FROM sync_state").fetchall())
+
+    def sync(self, fetcher, project_id, models):
+        # Downloads the versions created since the last sync of every model and
+        # returns how many new versions were stored. Versions at the high-water mark itself are
+        # fetched again: one created later with the same timestamp is not missed, and the ones
+        # already stored are only replaced. `fetcher` is a BulkVersionFetcher
+        # (many models per request), or anything with the same `fetch_since`.
+        since = {model_id: datetime.fromisoformat(mark) for model_id, mark in self.high_water_marks().items()}
+        model_versions = fetcher.fetch_since(project_id, models, since)
+
+        rows = []
+        new_marks = []
+        for model, versions in zip(models, model_versions):
+            if not versions:
+                continue
+            for v in versions:
+                rows.append((
+                    model.id,
+                    v["versionId"],
+                    v["sourceApplication"],
+                    v["authorName"],
+                    to_timestamp(v["createdAt"]),
+                    v["message"],
+                    v["referencedObject"],
+                ))
+            new_marks.append((model.id, max(to_timestamp(v["createdAt"]) for v in versions)))
+
+        with self._lock, self._conn:
+            stored = self._conn.execute("SELECT COUNT(*) FROM versions").fetchone()[0]
+            self._conn.executemany("INSERT OR REPLACE INTO versions VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.executemany(
+                """INSERT INTO sync_state VALUES (?, ?)
+                   ON CONFLICT(modelId) DO UPDATE SET highWaterMark = MAX(highWaterMark, excluded.highWaterMark)""",
+                new_marks,
+            )
+            return self._conn.execute("SELECT COUNT(*) FROM versions").fetchone()[0] - stored
+
+    def query(self, sql, params=()):
+        with self._lock:
+            return pd.read_sql_query(sql, self._conn, params=params)
+
+    def versions_frame(self, model_ids):
+        # All stored versions of the given models, newest first
+        if not model_ids:
+            return pd.DataFrame(columns=VERSION_FIELDS)
+        placeholders = ", ".join("?" for _ in model_ids)
+        df = self.query(
+            f"SELECT {', '.join(VERSION_FIELDS)} FROM versions WHERE modelId IN ({placeholders}) ORDER BY createdAt DESC",
+            tuple(model_ids),
+        )
+        df["createdAt"] = pd.to_datetime(df["createdAt"], utc=True, format="ISO8601")
+        return df
+
+    def close(self):
+        with self._lock:
+            self._conn.close()